@@ -6,8 +6,840 @@
 # version: 1.0
 
 import pyxel
+import argparse
+import atexit
+import hashlib
+import heapq
 import math
 import random
+import struct
+import time
+import numpy as np
+
+# 画面サイズ
+SCREEN_WIDTH = 160
+SCREEN_HEIGHT = 120
+
+# 衝突判定グリッドのセルサイズ（ピクセル）
+GRID_CELL_SIZE = 8
+# 弾の数 × 敵の数がこれ以下なら、空間ハッシュを使わずに全組み合わせを判定する
+BRUTE_FORCE_MAX_PAIRS = 30000
+# 敵の大きさ（ピクセル）
+ENEMY_SIZE = 8
+# 弾の速度
+BULLET_SPEED = 4
+
+# エネルギーボールの同時存在数の上限
+MAX_ENERGY_BALLS = 64
+# 新しいボールを既存のボールへ統合する距離と大きさの閾値
+ENERGY_BALL_MERGE_DISTANCE = 4
+ENERGY_BALL_MERGE_SIZE = 8
+# エネルギーボールの最大サイズ
+ENERGY_BALL_MAX_SIZE = 20
+# エネルギーボール1個分の1フレームあたりのダメージ
+ENERGY_BALL_DAMAGE = 0.1
+# エネルギーボールの当たり範囲マスクのセルサイズ（ピクセル）
+COVERAGE_CELL_SIZE = 4
+
+# エフェクトの種類と表示フレーム数
+EFFECT_HIT = 0
+EFFECT_DAMAGE = 1
+EFFECT_DURATION = (5, 10)
+# 同時に表示できるエフェクトの上限
+MAX_EFFECTS = 1024
+
+# 敵の追跡方法（direct: プレイヤーへ直進, flow: フローフィールドに沿って移動）
+AI_MODE_DIRECT = "direct"
+AI_MODE_FLOW = "flow"
+# フローフィールドのセルサイズ（ピクセル）
+FLOW_CELL_SIZE = 8
+
+# シミュレーションの更新レート（1秒あたりのステップ数）
+FPS = 30
+STEP_TIME = 1 / FPS
+# 1回の表示フレームで追加実行できるステップ数の上限
+MAX_FRAME_SKIP = 4
+
+# ボタン入力のビット
+BUTTON_SHOOT = 1 << 0
+BUTTON_DASH = 1 << 1
+BUTTON_SHIELD = 1 << 2
+BUTTON_POWER = 1 << 3
+BUTTON_ENERGY = 1 << 4
+BUTTON_AI_MODE = 1 << 5
+BUTTON_RESTART = 1 << 6
+BUTTON_SAVE_CHECKPOINT = 1 << 7
+BUTTON_LOAD_CHECKPOINT = 1 << 8
+
+# ボタンとゲームパッド・キーボードの対応
+BUTTON_BINDINGS = (
+    (BUTTON_SHOOT, (pyxel.GAMEPAD1_BUTTON_A, pyxel.KEY_J)),
+    (BUTTON_DASH, (pyxel.GAMEPAD1_BUTTON_B, pyxel.KEY_K)),
+    (BUTTON_SHIELD, (pyxel.GAMEPAD1_BUTTON_X, pyxel.KEY_U)),
+    (BUTTON_POWER, (pyxel.GAMEPAD1_BUTTON_Y, pyxel.KEY_I)),
+    (BUTTON_ENERGY, (pyxel.KEY_E,)),
+    (BUTTON_AI_MODE, (pyxel.GAMEPAD1_BUTTON_BACK, pyxel.KEY_TAB)),
+    (BUTTON_RESTART, (pyxel.GAMEPAD1_BUTTON_A, pyxel.KEY_SPACE)),
+    (BUTTON_SAVE_CHECKPOINT, (pyxel.GAMEPAD1_BUTTON_LEFTSHOULDER, pyxel.KEY_F5)),
+    (BUTTON_LOAD_CHECKPOINT, (pyxel.GAMEPAD1_BUTTON_RIGHTSHOULDER, pyxel.KEY_F9)),
+)
+
+# スプライトアトラスに使うイメージバンク
+ATLAS_IMAGE = 0
+# プレイヤーの色（通常時とパワーモードの点滅時）
+PLAYER_COLORS = (12, 10)  # 水色または黄色
+# シールドの半径
+SHIELD_RADIUS = 10
+
+# 敵の種類ごとのパラメータ（インデックスは種類: 0=通常, 1=エリート）
+ENEMY_NORMAL = 0
+ENEMY_ELITE = 1
+ENEMY_SPEED = np.array([1.0, 2.0])
+ENEMY_HEALTH = (2, 4)
+ENEMY_COLOR = (8, 10)  # 赤または黄色
+ENEMY_SCORE = (1, 2)
+
+
+class InputState:
+    """シミュレーション1ステップ分の入力（スティックの値とボタンの押下状態）
+
+    表示フレームごとに poll で読み取り、押した瞬間の入力はステップで消費されるまで保持する。
+    """
+
+    def __init__(self):
+        self.left_x = 0
+        self.left_y = 0
+        self.right_x = 0
+        self.right_y = 0
+        self.trigger_right = 0
+        self.held = 0
+        self.pressed = 0
+
+    def poll(self):
+        """pyxelからゲームパッドとキーボードの入力を読み取る"""
+        # アナログスティックによる移動（キーボード入力で上書き）
+        lx = pyxel.btnv(pyxel.GAMEPAD1_AXIS_LEFTX)
+        ly = pyxel.btnv(pyxel.GAMEPAD1_AXIS_LEFTY)
+        if pyxel.btn(pyxel.KEY_LEFT) or pyxel.btn(pyxel.KEY_A):
+            lx = -32767
+        elif pyxel.btn(pyxel.KEY_RIGHT) or pyxel.btn(pyxel.KEY_D):
+            lx = 32767
+        if pyxel.btn(pyxel.KEY_UP) or pyxel.btn(pyxel.KEY_W):
+            ly = -32767
+        elif pyxel.btn(pyxel.KEY_DOWN) or pyxel.btn(pyxel.KEY_S):
+            ly = 32767
+        self.left_x = lx
+        self.left_y = ly
+        self.right_x = pyxel.btnv(pyxel.GAMEPAD1_AXIS_RIGHTX)
+        self.right_y = pyxel.btnv(pyxel.GAMEPAD1_AXIS_RIGHTY)
+        self.trigger_right = pyxel.btnv(pyxel.GAMEPAD1_AXIS_TRIGGERRIGHT)
+
+        held = 0
+        pressed = 0
+        for bit, keys in BUTTON_BINDINGS:
+            for key in keys:
+                if pyxel.btn(key):
+                    held |= bit
+                if pyxel.btnp(key):
+                    pressed |= bit
+        self.held = held
+        self.pressed |= pressed
+
+    def consume(self):
+        """ステップで処理した押下の瞬間の入力を消去する"""
+        self.pressed = 0
+
+    def btn(self, bit):
+        return self.held & bit != 0
+
+    def btnp(self, bit):
+        return self.pressed & bit != 0
+
+
+class InputRecorder:
+    """ステップごとの入力と乱数のシード値をバイナリファイルへ記録する
+
+    ファイルはヘッダ（識別子, バージョン, シード値, 追跡方法）の後に
+    1ステップ14バイトの入力レコードが続く形式。
+    """
+
+    MAGIC = b"AGRP"
+    VERSION = 2
+    HEADER = struct.Struct("<4sHIB")
+    RECORD = struct.Struct("<hhhhhHH")
+    FLUSH_INTERVAL = 60  # ステップ
+
+    def __init__(self, path, seed, ai_mode):
+        self.path = path
+        with open(path, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, seed, ai_mode == AI_MODE_FLOW))
+        self.buffer = bytearray()  # まだファイルへ書いていないレコード
+        self.count = 0
+
+    def write(self, state):
+        self.buffer += self.RECORD.pack(
+            state.left_x,
+            state.left_y,
+            state.right_x,
+            state.right_y,
+            state.trigger_right,
+            state.held,
+            state.pressed,
+        )
+        self.count += 1
+        if self.count % self.FLUSH_INTERVAL == 0:
+            self.flush()
+
+    def flush(self):
+        """溜めたレコードをファイルの末尾へ追記する"""
+        if self.buffer:
+            with open(self.path, "ab") as f:
+                f.write(self.buffer)
+            self.buffer.clear()
+
+    def close(self):
+        self.flush()
+
+
+class InputReplay:
+    """InputRecorder で記録したファイルを読み込み、ステップごとに入力を再現する"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        header = InputRecorder.HEADER
+        magic, version, self.seed, flow = header.unpack_from(data)
+        if magic != InputRecorder.MAGIC or version != InputRecorder.VERSION:
+            raise ValueError(f"{path} is not an input recording")
+        self.ai_mode = AI_MODE_FLOW if flow else AI_MODE_DIRECT
+        body = data[header.size :]
+        body = body[: len(body) - len(body) % InputRecorder.RECORD.size]
+        self.records = list(InputRecorder.RECORD.iter_unpack(body))
+        self.position = 0
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def finished(self):
+        return self.position >= len(self.records)
+
+    def read(self, state):
+        """次のステップの入力を state へ書き込む"""
+        (
+            state.left_x,
+            state.left_y,
+            state.right_x,
+            state.right_y,
+            state.trigger_right,
+            state.held,
+            state.pressed,
+        ) = self.records[self.position]
+        self.position += 1
+
+
+class TelemetryRecorder:
+    """1フレームごとの計測値を固定長のバイナリレコードとしてファイルへ書き出す
+
+    レコードは事前に確保したリングバッファへ詰め、一杯になったときにまとめて書き込む。
+    """
+
+    MAGIC = b"AGTM"
+    VERSION = 1
+    HEADER = struct.Struct("<4sHH")
+    # フレーム番号, 敵, 弾, エネルギーボール, エフェクト, 更新時間(ms), 描画時間(ms), スコア, 体力
+    RECORD = struct.Struct("<IIIIIffii")
+    DTYPE = np.dtype(
+        [
+            ("frame", "<u4"),
+            ("enemies", "<u4"),
+            ("bullets", "<u4"),
+            ("energy_balls", "<u4"),
+            ("effects", "<u4"),
+            ("update_ms", "<f4"),
+            ("draw_ms", "<f4"),
+            ("score", "<i4"),
+            ("health", "<i4"),
+        ]
+    )
+
+    def __init__(self, path, capacity=1024):
+        self.path = path
+        with open(path, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.RECORD.size))
+        self.buffer = bytearray(self.RECORD.size * capacity)
+        self.view = memoryview(self.buffer)
+        self.capacity = capacity
+        self.count = 0
+
+    def write(self, frame, enemies, bullets, energy_balls, effects, update_ms, draw_ms, score, health):
+        self.RECORD.pack_into(
+            self.buffer,
+            self.count * self.RECORD.size,
+            frame,
+            enemies,
+            bullets,
+            energy_balls,
+            effects,
+            update_ms,
+            draw_ms,
+            score,
+            health,
+        )
+        self.count += 1
+        if self.count == self.capacity:
+            self.flush()
+
+    def flush(self):
+        """溜めたレコードをファイルの末尾へ追記する"""
+        if self.count > 0:
+            with open(self.path, "ab") as f:
+                f.write(self.view[: self.count * self.RECORD.size])
+            self.count = 0
+
+    def close(self):
+        self.flush()
+
+
+def load_telemetry(path):
+    """TelemetryRecorder で記録したファイルを構造化配列として読み込む"""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, record_size = TelemetryRecorder.HEADER.unpack_from(data)
+    if magic != TelemetryRecorder.MAGIC or version != TelemetryRecorder.VERSION:
+        raise ValueError(f"{path} is not a telemetry recording")
+    body = data[TelemetryRecorder.HEADER.size :]
+    count = len(body) // record_size
+    return np.frombuffer(body, dtype=TelemetryRecorder.DTYPE, count=count)
+
+
+def summarize_telemetry(path, worst=10):
+    """テレメトリのパーセンタイルと最も遅かったフレームを表示する"""
+    records = load_telemetry(path)
+    if len(records) == 0:
+        print("no records")
+        return
+    print(f"frames: {len(records)}")
+    for name in ("update_ms", "draw_ms", "enemies", "bullets", "energy_balls", "effects"):
+        values = records[name]
+        p50, p90, p99 = np.percentile(values, (50, 90, 99))
+        print(f"{name}: p50 {p50:.3f} p90 {p90:.3f} p99 {p99:.3f} max {values.max():.3f}")
+    total = records["update_ms"] + records["draw_ms"]
+    print(f"slowest {worst} frames:")
+    for i in np.argsort(total)[::-1][:worst]:
+        record = records[i]
+        print(
+            f"  frame {record['frame']}: update {record['update_ms']:.2f}ms draw {record['draw_ms']:.2f}ms "
+            f"enemies {record['enemies']} bullets {record['bullets']} "
+            f"energy balls {record['energy_balls']} effects {record['effects']}"
+        )
+
+
+class BotController:
+    """ゲームの状態を見て InputState を組み立てる自動操作プレイヤー（負荷試験用）
+
+    敵から離れるように移動し、最も近い敵を狙って撃ち、接近されたらシールドやダッシュ、
+    囲まれたらパワーモードとエネルギーボールを使う。
+    """
+
+    SHOOT_INTERVAL = 4  # ステップ
+    SHIELD_DISTANCE = 14
+    DASH_DISTANCE = 24
+    CROWD_DISTANCE = 40
+    CROWD_SIZE = 4
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.steps = 0
+
+    def act(self, game, state):
+        """次のステップの入力を state へ書き込む"""
+        self.steps += 1
+        state.left_x = state.left_y = state.right_x = state.right_y = 0
+        state.trigger_right = 0
+        state.held = 0
+        state.pressed = 0
+
+        if game.game_over:
+            # 1ステップおきに押し直してリスタートする
+            if self.steps % 2 == 0:
+                state.held = state.pressed = BUTTON_RESTART
+            return
+
+        player = game.player
+        px = player.x + player.size / 2
+        py = player.y + player.size / 2
+
+        # 画面中央へ戻る力
+        move_x = (SCREEN_WIDTH / 2 - px) * 0.002
+        move_y = (SCREEN_HEIGHT / 2 - py) * 0.002
+
+        n = game.enemies.count
+        if n > 0:
+            dx = game.enemies.x[:n] + ENEMY_SIZE / 2 - px
+            dy = game.enemies.y[:n] + ENEMY_SIZE / 2 - py
+            dist2 = dx * dx + dy * dy + 1.0
+            dist = np.sqrt(dist2)
+
+            # 敵から離れる力（近い敵ほど強い）
+            move_x -= float(np.sum(dx / (dist2 * dist))) * 40
+            move_y -= float(np.sum(dy / (dist2 * dist))) * 40
+
+            # 最も近い敵を狙う
+            nearest = int(np.argmin(dist2))
+            nearest_dist = float(dist[nearest])
+            state.right_x = int(dx[nearest] / nearest_dist * 32767)
+            state.right_y = int(dy[nearest] / nearest_dist * 32767)
+            if self.steps % self.SHOOT_INTERVAL == 0:
+                state.pressed |= BUTTON_SHOOT
+                state.held |= BUTTON_SHOOT
+
+            if nearest_dist < self.SHIELD_DISTANCE:
+                state.held |= BUTTON_SHIELD
+            if nearest_dist < self.DASH_DISTANCE:
+                state.held |= BUTTON_DASH
+                if player.dash_cooldown <= 0:
+                    state.pressed |= BUTTON_DASH
+
+            crowd = int(np.count_nonzero(dist < self.CROWD_DISTANCE))
+            if crowd >= self.CROWD_SIZE and not player.power_mode:
+                state.held |= BUTTON_POWER
+                state.pressed |= BUTTON_POWER
+            if crowd >= 2:
+                state.trigger_right = 32767
+
+        # ときどき揺らして同じ場所に留まらないようにする
+        move_x += self.rng.uniform(-0.05, 0.05)
+        move_y += self.rng.uniform(-0.05, 0.05)
+        length = math.hypot(move_x, move_y)
+        if length > 0.02:
+            state.left_x = int(move_x / length * 32767)
+            state.left_y = int(move_y / length * 32767)
+
+
+class SpatialHash:
+    """一様グリッドによる空間ハッシュ（衝突判定のブロードフェーズ用）
+
+    要素のインデックスをセル番号の順に並べた配列で持ち、各セルの範囲は二分探索で求める。
+    セル番号は (セルの x << 32) + セルの y で、セルの並びと大小関係が一致する。
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.keys = np.zeros(0, dtype=np.int64)  # 要素のセル番号（昇順）
+        self.order = np.zeros(0, dtype=np.intp)  # keys と同じ順に並べた要素のインデックス
+
+    def cell_keys(self, cx, cy):
+        return (np.asarray(cx, dtype=np.int64) << 32) + np.asarray(cy, dtype=np.int64)
+
+    def rebuild(self, xs, ys):
+        """座標の配列からグリッドを再構築する（同じセルの要素はインデックスの昇順に並ぶ）"""
+        keys = self.cell_keys(np.floor_divide(xs, self.cell_size), np.floor_divide(ys, self.cell_size))
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+
+    def query_pairs(self, x0, y0, x1, y1):
+        """矩形の配列それぞれについて、重なるセルに属する要素を (矩形の番号, 要素のインデックス) の配列の組で返す"""
+        cell_size = self.cell_size
+        cx0 = np.floor_divide(x0, cell_size).astype(np.int64)
+        cy0 = np.floor_divide(y0, cell_size).astype(np.int64)
+        span_x = np.floor_divide(x1, cell_size).astype(np.int64) - cx0 + 1
+        span_y = np.floor_divide(y1, cell_size).astype(np.int64) - cy0 + 1
+        if len(cx0) == 0 or len(self.keys) == 0:
+            empty = np.zeros(0, dtype=np.intp)
+            return empty, empty
+
+        # 各矩形が掛かるセルを (矩形, x方向のずれ, y方向のずれ) の組で列挙する
+        offset_x = np.arange(span_x.max())[:, None]
+        offset_y = np.arange(span_y.max())[None, :]
+        inside = (offset_x < span_x[:, None, None]) & (offset_y < span_y[:, None, None])
+        rect, ox, oy = np.nonzero(inside)
+        keys = self.cell_keys(cx0[rect] + ox, cy0[rect] + oy)
+
+        # セルごとの要素の範囲を求めて展開する
+        start = np.searchsorted(self.keys, keys, side="left")
+        counts = np.searchsorted(self.keys, keys, side="right") - start
+        total = counts.sum()
+        positions = np.arange(total) - np.repeat(np.cumsum(counts) - counts - start, counts)
+        return np.repeat(rect, counts), self.order[positions]
+
+
+class EntityStore:
+    """位置・速度・体力・種類を並列のNumPy配列で保持するエンティティ群
+
+    要素は先頭から count 個が有効で、削除は末尾の要素で穴を埋めるスワップ削除で行う。
+    """
+
+    FIELDS = (
+        ("x", np.float64),
+        ("y", np.float64),
+        ("vx", np.float64),
+        ("vy", np.float64),
+        ("health", np.float64),
+        ("type", np.int8),
+    )
+
+    def __init__(self, capacity=256):
+        self.count = 0
+        for name, dtype in self.FIELDS:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    def __len__(self):
+        return self.count
+
+    def add(self, x, y, vx=0.0, vy=0.0, health=0.0, type=0):
+        """要素を追加してインデックスを返す（容量不足時は倍に拡張）"""
+        if self.count == len(self.x):
+            self.grow(len(self.x) * 2)
+        i = self.count
+        self.x[i] = x
+        self.y[i] = y
+        self.vx[i] = vx
+        self.vy[i] = vy
+        self.health[i] = health
+        self.type[i] = type
+        self.count += 1
+        return i
+
+    def grow(self, capacity):
+        """配列の容量を拡張する"""
+        for name, _ in self.FIELDS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[: self.count] = old[: self.count]
+            setattr(self, name, new)
+
+    def compact(self, keep):
+        """keepがFalseの要素を削除する（末尾の生存要素を穴へ移すスワップ削除）"""
+        n = self.count
+        alive = int(np.count_nonzero(keep))
+        if alive == n:
+            return
+        holes = np.flatnonzero(~keep[:alive])
+        movers = np.flatnonzero(keep[alive:n]) + alive
+        for name, _ in self.FIELDS:
+            array = getattr(self, name)
+            array[holes] = array[movers]
+        self.count = alive
+
+    def clear(self):
+        self.count = 0
+
+
+class EnergyBallStore(EntityStore):
+    """エネルギーボール群（容量は固定で、近くのボールは1個に統合して重みを加算する）"""
+
+    FIELDS = (
+        ("x", np.float64),
+        ("y", np.float64),
+        ("size", np.float64),
+        ("growing", np.bool_),
+        ("weight", np.float64),
+    )
+
+    def __init__(self, capacity=MAX_ENERGY_BALLS):
+        super().__init__(capacity)
+
+    def add(self, x, y, size=4):
+        """ボールを追加する（生成直後のボールが近くにあれば統合する）"""
+        n = self.count
+        if n > 0:
+            dx = np.abs(self.x[:n] - x)
+            dy = np.abs(self.y[:n] - y)
+            young = self.growing[:n] & (self.size[:n] <= ENERGY_BALL_MERGE_SIZE)
+            near = np.flatnonzero(young & (dx <= ENERGY_BALL_MERGE_DISTANCE) & (dy <= ENERGY_BALL_MERGE_DISTANCE))
+            if len(near) > 0:
+                self.weight[near[0]] += 1
+                return near[0]
+            if n == len(self.x):
+                # 上限に達したら最も近いボールへ統合する
+                i = int(np.argmin(dx + dy))
+                self.weight[i] += 1
+                return i
+        i = n
+        self.x[i] = x
+        self.y[i] = y
+        self.size[i] = size
+        self.growing[i] = True
+        self.weight[i] = 1
+        self.count += 1
+        return i
+
+
+class CoverageMask:
+    """エネルギーボールの当たり範囲を低解像度グリッドへ描き込んだ強度マスク
+
+    各セルの値はそのセルに左上座標がある敵に重なるボールの重みの合計で、
+    ボールの矩形は2次元の差分配列へ書き込んでから累積和で展開する。
+    """
+
+    def __init__(self, width, height, cell_size, margin):
+        self.cell_size = cell_size
+        self.origin = -margin
+        self.cols = (width + margin * 2) // cell_size + 1
+        self.rows = (height + margin * 2) // cell_size + 1
+        self.intensity = np.zeros((self.rows, self.cols))
+
+    def rasterize(self, balls):
+        """全てのボールを強度マスクへ描き込む"""
+        n = balls.count
+        if n == 0:
+            self.intensity.fill(0)
+            return
+        reach = balls.size[:n] + ENEMY_SIZE
+        x0 = self.to_cell(balls.x[:n] - reach, self.cols)
+        x1 = self.to_cell(balls.x[:n] + reach, self.cols) + 1
+        y0 = self.to_cell(balls.y[:n] - reach, self.rows)
+        y1 = self.to_cell(balls.y[:n] + reach, self.rows) + 1
+        weight = balls.weight[:n]
+
+        diff = np.zeros((self.rows + 1, self.cols + 1))
+        np.add.at(diff, (y0, x0), weight)
+        np.add.at(diff, (y0, x1), -weight)
+        np.add.at(diff, (y1, x0), -weight)
+        np.add.at(diff, (y1, x1), weight)
+        self.intensity = diff.cumsum(axis=0).cumsum(axis=1)[: self.rows, : self.cols]
+
+    def sample(self, xs, ys):
+        """座標列に対応するセルの強度を返す"""
+        return self.intensity[self.to_cell(ys, self.rows), self.to_cell(xs, self.cols)]
+
+    def to_cell(self, values, limit):
+        cells = np.floor((np.asarray(values) - self.origin) / self.cell_size).astype(np.intp)
+        return np.clip(cells, 0, limit - 1)
+
+
+class EffectWheel:
+    """終了フレームごとのバケットで寿命を管理するエフェクト群（タイミングホイール）
+
+    スロットは事前に確保しておき、毎フレームは終了するバケットだけを処理する。
+    描画用に生存中のスロットを密な配列 live で保持する。
+    """
+
+    WHEEL_SIZE = 16  # 最長の表示フレーム数より大きくする
+
+    def __init__(self, capacity=MAX_EFFECTS):
+        self.tick = 0
+        self.x = [0.0] * capacity
+        self.y = [0.0] * capacity
+        self.type = [0] * capacity
+        self.expire = [0] * capacity
+        self.live = []
+        self.live_index = [0] * capacity
+        self.free = list(range(capacity - 1, -1, -1))
+        self.buckets = [[] for _ in range(self.WHEEL_SIZE)]
+
+    def __len__(self):
+        return len(self.live)
+
+    def add(self, x, y, effect_type, expire=None):
+        """エフェクトを追加する（空きスロットが無い場合は追加しない）"""
+        if not self.free:
+            return
+        slot = self.free.pop()
+        self.x[slot] = x
+        self.y[slot] = y
+        self.type[slot] = effect_type
+        if expire is None:
+            expire = self.tick + EFFECT_DURATION[effect_type]
+        self.expire[slot] = expire
+        self.buckets[expire % self.WHEEL_SIZE].append(slot)
+        self.live_index[slot] = len(self.live)
+        self.live.append(slot)
+
+    def advance(self):
+        """1フレーム進め、終了したエフェクトのスロットを解放する"""
+        self.tick += 1
+        bucket = self.buckets[self.tick % self.WHEEL_SIZE]
+        live = self.live
+        live_index = self.live_index
+        for slot in bucket:
+            # 末尾のスロットで穴を埋める
+            i = live_index[slot]
+            last = live.pop()
+            if last != slot:
+                live[i] = last
+                live_index[last] = i
+            self.free.append(slot)
+        bucket.clear()
+
+    def timer(self, slot):
+        """残り表示フレーム数"""
+        return self.expire[slot] - self.tick
+
+    def reset(self, tick):
+        """全てのエフェクトを消去し、現在のフレームを設定する"""
+        self.free.extend(self.live)
+        self.live.clear()
+        for bucket in self.buckets:
+            bucket.clear()
+        self.tick = tick
+
+
+class FlowField:
+    """プレイヤーのセルからの距離場と、各セルでの進行方向を持つグリッド
+
+    距離場はダイクストラ法で求め、プレイヤーが別のセルへ移動したときだけ再計算する。
+    blocked が True のセルは障害物として扱う。
+    """
+
+    # 8近傍の (列, 行) 方向と移動コスト
+    NEIGHBORS = (
+        (1, 0, 1.0),
+        (-1, 0, 1.0),
+        (0, 1, 1.0),
+        (0, -1, 1.0),
+        (1, 1, math.sqrt(2)),
+        (1, -1, math.sqrt(2)),
+        (-1, 1, math.sqrt(2)),
+        (-1, -1, math.sqrt(2)),
+    )
+
+    def __init__(self, width, height, cell_size, blocked=None):
+        self.cell_size = cell_size
+        self.cols = -(-width // cell_size)
+        self.rows = -(-height // cell_size)
+        if blocked is None:
+            blocked = np.zeros((self.rows, self.cols), dtype=bool)
+        self.blocked = blocked
+        self.distance = np.full((self.rows, self.cols), np.inf)
+        self.dir_x = np.zeros((self.rows, self.cols))
+        self.dir_y = np.zeros((self.rows, self.cols))
+        self.goal = None
+
+    def update(self, x, y):
+        """目標座標のセルが変わっていれば距離場と進行方向を再計算する"""
+        goal = (self.to_row(y), self.to_col(x))
+        if goal == self.goal:
+            return
+        self.goal = goal
+        self.compute_distance(goal)
+        self.compute_directions()
+
+    def compute_distance(self, goal):
+        rows, cols = self.rows, self.cols
+        blocked = self.blocked.tolist()
+        distance = [[math.inf] * cols for _ in range(rows)]
+        distance[goal[0]][goal[1]] = 0.0
+        queue = [(0.0, goal[0], goal[1])]
+        while queue:
+            d, row, col = heapq.heappop(queue)
+            if d > distance[row][col]:
+                continue
+            for dc, dr, cost in self.NEIGHBORS:
+                r = row + dr
+                c = col + dc
+                if r < 0 or r >= rows or c < 0 or c >= cols or blocked[r][c]:
+                    continue
+                # 障害物の角をすり抜ける斜め移動はしない
+                if dr and dc and (blocked[row][c] or blocked[r][col]):
+                    continue
+                nd = d + cost
+                if nd < distance[r][c]:
+                    distance[r][c] = nd
+                    heapq.heappush(queue, (nd, r, c))
+        self.distance = np.array(distance)
+
+    def compute_directions(self):
+        """各セルから最も距離が縮む隣接セルへの単位ベクトルを求める"""
+        padded = np.pad(self.distance, 1, constant_values=np.inf)
+        best = np.full((self.rows, self.cols), np.inf)
+        self.dir_x.fill(0)
+        self.dir_y.fill(0)
+        for dc, dr, cost in self.NEIGHBORS:
+            candidate = padded[1 + dr : 1 + dr + self.rows, 1 + dc : 1 + dc + self.cols] + cost
+            better = candidate < best
+            best[better] = candidate[better]
+            self.dir_x[better] = dc / cost
+            self.dir_y[better] = dr / cost
+        # 目標セルと到達できないセルでは止まる
+        still = (self.distance == 0) | ~np.isfinite(self.distance)
+        self.dir_x[still] = 0
+        self.dir_y[still] = 0
+
+    def sample(self, xs, ys):
+        """座標列に対応するセルの進行方向を返す（目標セル内かどうかも返す）"""
+        rows = self.to_row(ys)
+        cols = self.to_col(xs)
+        return self.dir_x[rows, cols], self.dir_y[rows, cols], self.distance[rows, cols] == 0
+
+    def to_col(self, x):
+        return np.clip(np.floor_divide(x, self.cell_size).astype(np.intp), 0, self.cols - 1)
+
+    def to_row(self, y):
+        return np.clip(np.floor_divide(y, self.cell_size).astype(np.intp), 0, self.rows - 1)
+
+
+class SpriteAtlas:
+    """起動時に図形をイメージバンクへ描いておき、blt だけで描画するためのアトラス
+
+    スプライトは左上から行単位で詰めて配置し、キーごとに (u, v, w, h, 中心x, 中心y) を保持する。
+    """
+
+    def __init__(self, image_index):
+        self.image_index = image_index
+        self.image = pyxel.images[image_index]
+        self.image.cls(0)
+        self.sprites = {}
+        self.cursor_x = 0
+        self.cursor_y = 0
+        self.row_height = 0
+
+    def allocate(self, w, h):
+        """w x h の領域を確保して左上座標を返す"""
+        if self.cursor_x + w > self.image.width:
+            self.cursor_x = 0
+            self.cursor_y += self.row_height
+            self.row_height = 0
+        if self.cursor_y + h > self.image.height:
+            raise ValueError("sprite atlas is full")
+        u = self.cursor_x
+        v = self.cursor_y
+        self.cursor_x += w
+        self.row_height = max(self.row_height, h)
+        return u, v
+
+    def add_player(self, color):
+        size = 8
+        u, v = self.allocate(size + 1, size + 1)
+        self.image.tri(u, v + size, u + size, v + size / 2, u, v, color)
+        self.sprites[("player", color)] = (u, v, size + 1, size + 1, 0, 0)
+
+    def add_rect(self, key, w, h, color):
+        u, v = self.allocate(w, h)
+        self.image.rect(u, v, w, h, color)
+        self.sprites[key] = (u, v, w, h, 0, 0)
+
+    def add_ring(self, radius, color):
+        size = radius * 2 + 1
+        u, v = self.allocate(size, size)
+        self.image.circb(u + radius, v + radius, radius, color)
+        self.sprites[("ring", radius, color)] = (u, v, size, size, radius, radius)
+
+    def draw(self, key, x, y):
+        """キーに対応するスプライトを描画する（色0は透明）"""
+        u, v, w, h, ox, oy = self.sprites[key]
+        pyxel.blt(x - ox, y - oy, self.image_index, u, v, w, h, 0)
+
+    def draw_ring(self, x, y, radius, color):
+        self.draw(("ring", radius, color), x, y)
+
+
+def build_atlas():
+    """ゲームで使う図形を全てアトラスへ描いておく"""
+    atlas = SpriteAtlas(ATLAS_IMAGE)
+    # 大きいものから並べる
+    for radius in range(ENERGY_BALL_MAX_SIZE, -1, -1):
+        atlas.add_ring(radius, 8)  # エネルギーボール（成長中）とダメージエフェクト: 赤色
+        atlas.add_ring(radius, 9)  # エネルギーボール（縮小中）: 橙色
+    atlas.add_ring(SHIELD_RADIUS, 12)  # シールド: 水色
+    for timer in range(1, EFFECT_DURATION[EFFECT_HIT] + 1):
+        atlas.add_ring(10 - timer, 10)  # ヒットエフェクト: 黄色
+    for color in PLAYER_COLORS:
+        atlas.add_player(color)
+    for enemy_type, color in enumerate(ENEMY_COLOR):
+        atlas.add_rect(("enemy", enemy_type), ENEMY_SIZE, ENEMY_SIZE, color)
+    return atlas
 
 
 class Player:
@@ -17,50 +849,307 @@ class Player:
         self.speed = 2
         self.dash_speed = 4
         self.size = 8
-        self.color = 12  # 水色
+        self.color = PLAYER_COLORS[0]
         self.shield_active = False
         self.dash_active = False
         self.power_mode = False
         self.power_timer = 0
-        self.bullets = []
-        self.energy_balls = []
+        self.bullets = EntityStore()
+        self.energy_balls = EnergyBallStore()
         self.dash_cooldown = 0
         self.health = 100
         self.score = 0
 
 
-class Enemy:
-    def __init__(self, x, y, type="normal"):
-        self.x = x
-        self.y = y
-        self.type = type
-        self.speed = 1 if type == "normal" else 2
-        self.size = 8
-        self.health = 2 if type == "normal" else 4
-        self.color = 8 if type == "normal" else 10  # 赤または黄色
+class GameSnapshot:
+    """Game の状態を事前に確保したバイト列へ保存し、そこから復元する
+
+    プレイヤー・弾・エネルギーボール・敵・エフェクト・敵の出現タイマー・乱数の状態を
+    固定長のヘッダと各配列の生データとして詰める。bytes(snapshot) で送受信用の
+    バイト列を取り出し、load で読み込める。
+    """
+
+    HEADER = struct.Struct("<dd???iiiiiq??")
+    RNG_STATE = struct.Struct("<625I?d")
+    COUNT = struct.Struct("<I")
+    EFFECT_FIELDS = (("x", np.float64), ("y", np.float64), ("type", np.int8), ("expire", np.int64))
+
+    def __init__(self, capacity=65536):
+        self.buffer = bytearray(capacity)
+        self.size = 0
+
+    def __bytes__(self):
+        return bytes(self.buffer[: self.size])
+
+    def load(self, data):
+        """バイト列を読み込む（restore で Game へ反映する）"""
+        if len(data) > len(self.buffer):
+            self.buffer = bytearray(len(data) * 2)
+        self.buffer[: len(data)] = data
+        self.size = len(data)
+
+    def required_size(self, game):
+        size = self.HEADER.size + self.RNG_STATE.size
+        for store in self.stores(game):
+            size += self.COUNT.size + sum(np.dtype(dtype).itemsize for _, dtype in store.FIELDS) * store.count
+        size += self.COUNT.size + sum(np.dtype(dtype).itemsize for _, dtype in self.EFFECT_FIELDS) * len(game.effects)
+        return size
+
+    def stores(self, game):
+        return (game.player.bullets, game.player.energy_balls, game.enemies)
+
+    def save(self, game):
+        """Game の状態をバッファへ書き込む"""
+        required = self.required_size(game)
+        if required > len(self.buffer):
+            self.buffer = bytearray(required * 2)
+        buffer = self.buffer
+        player = game.player
+        self.HEADER.pack_into(
+            buffer,
+            0,
+            player.x,
+            player.y,
+            player.shield_active,
+            player.dash_active,
+            player.power_mode,
+            player.power_timer,
+            player.dash_cooldown,
+            player.health,
+            player.score,
+            game.spawn_timer,
+            game.effects.tick,
+            game.game_over,
+            game.ai_mode == AI_MODE_FLOW,
+        )
+        offset = self.HEADER.size
+
+        _, internal, gauss = game.rng.getstate()
+        self.RNG_STATE.pack_into(buffer, offset, *internal, gauss is not None, gauss or 0.0)
+        offset += self.RNG_STATE.size
+
+        for store in self.stores(game):
+            offset = self.write_arrays(
+                offset, store.count, [(getattr(store, name), dtype) for name, dtype in store.FIELDS]
+            )
+
+        effects = game.effects
+        live = effects.live
+        columns = []
+        for name, dtype in self.EFFECT_FIELDS:
+            values = getattr(effects, name)
+            columns.append((np.array([values[slot] for slot in live], dtype=dtype), dtype))
+        offset = self.write_arrays(offset, len(live), columns)
+        self.size = offset
+
+    def write_arrays(self, offset, count, columns):
+        self.COUNT.pack_into(self.buffer, offset, count)
+        offset += self.COUNT.size
+        for array, dtype in columns:
+            np.frombuffer(self.buffer, dtype=dtype, count=count, offset=offset)[:] = array[:count]
+            offset += np.dtype(dtype).itemsize * count
+        return offset
+
+    def restore(self, game):
+        """バッファの内容で Game の状態を上書きする"""
+        buffer = self.buffer
+        player = game.player
+        (
+            player.x,
+            player.y,
+            player.shield_active,
+            player.dash_active,
+            player.power_mode,
+            player.power_timer,
+            player.dash_cooldown,
+            player.health,
+            player.score,
+            game.spawn_timer,
+            tick,
+            game.game_over,
+            flow,
+        ) = self.HEADER.unpack_from(buffer, 0)
+        game.ai_mode = AI_MODE_FLOW if flow else AI_MODE_DIRECT
+        game.flow_field.goal = None  # 距離場は次のステップで作り直す
+        offset = self.HEADER.size
+
+        *internal, has_gauss, gauss = self.RNG_STATE.unpack_from(buffer, offset)
+        game.rng.setstate((3, tuple(internal), gauss if has_gauss else None))
+        offset += self.RNG_STATE.size
+
+        for store in self.stores(game):
+            count = self.COUNT.unpack_from(buffer, offset)[0]
+            offset += self.COUNT.size
+            if count > len(store.x):
+                store.grow(count)
+            for name, dtype in store.FIELDS:
+                getattr(store, name)[:count] = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+                offset += np.dtype(dtype).itemsize * count
+            store.count = count
+
+        count = self.COUNT.unpack_from(buffer, offset)[0]
+        offset += self.COUNT.size
+        columns = []
+        for _, dtype in self.EFFECT_FIELDS:
+            columns.append(np.frombuffer(buffer, dtype=dtype, count=count, offset=offset).tolist())
+            offset += np.dtype(dtype).itemsize * count
+        effects = game.effects
+        effects.reset(tick)
+        for x, y, effect_type, expire in zip(*columns):
+            effects.add(x, y, effect_type, expire)
 
 
 class Game:
-    def __init__(self):
-        pyxel.init(160, 120)
+    def __init__(
+        self,
+        ai_mode=AI_MODE_DIRECT,
+        max_frame_skip=MAX_FRAME_SKIP,
+        seed=None,
+        headless=False,
+        record_path=None,
+        replay=None,
+        bot=None,
+        telemetry_path=None,
+    ):
+        # ヘッドレスモードではウィンドウを作らず、step を直接呼び出して使う
+        self.headless = headless
+        if not headless:
+            pyxel.init(SCREEN_WIDTH, SCREEN_HEIGHT, fps=FPS)
+            self.atlas = build_atlas()
+
+        # リプレイ時は記録されたシード値と追跡方法を使う
+        self.replay = replay
+        self.bot = bot
+        if replay is not None:
+            seed = replay.seed
+            ai_mode = replay.ai_mode
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.ai_mode = ai_mode
+        self.input = InputState()
+        self.recorder = InputRecorder(record_path, seed, ai_mode) if record_path else None
+        self.checkpoint = GameSnapshot()
+        self.telemetry = TelemetryRecorder(telemetry_path) if telemetry_path else None
+        # ESC以外（ウィンドウを閉じた場合など）で終了しても記録を書き出す。pyxel は終了時に atexit の処理を呼ぶ
+        if self.recorder is not None or self.telemetry is not None:
+            atexit.register(self.close)
+        self.update_ms = 0.0
+
+        # 固定ステップ更新の状態
+        self.max_frame_skip = max_frame_skip
+        self.accumulator = 0.0
+        self.last_time = None
+        self.sim_steps = 0  # 実行したシミュレーションのステップ数
+        self.rendered_frames = 0  # 描画したフレーム数
+        self.dropped_steps = 0  # 処理落ちで切り捨てたステップ数
+        self.show_stats = False
+
         self.reset_game()
-        pyxel.run(self.update, self.draw)
+        if not headless:
+            pyxel.run(self.update, self.draw)
 
     def reset_game(self):
         self.player = Player(80, 60)
-        self.enemies = []
-        self.effects = []
+        self.enemies = EntityStore()
+        self.effects = EffectWheel()
         self.game_over = False
         self.spawn_timer = 0
+        self.enemy_grid = SpatialHash(GRID_CELL_SIZE)
+        self.coverage = CoverageMask(
+            SCREEN_WIDTH, SCREEN_HEIGHT, COVERAGE_CELL_SIZE, ENERGY_BALL_MAX_SIZE + ENEMY_SIZE + COVERAGE_CELL_SIZE
+        )
+        self.flow_field = FlowField(SCREEN_WIDTH, SCREEN_HEIGHT, FLOW_CELL_SIZE)
 
     def update(self):
+        update_start = time.perf_counter()
+
         # スタートボタンで終了
-        if pyxel.btn(pyxel.GAMEPAD1_BUTTON_START) or pyxel.btn(pyxel.KEY_ESCAPE):
+        if pyxel.btn(pyxel.GAMEPAD1_BUTTON_START) or pyxel.btn(pyxel.KEY_ESCAPE) or self.replay_finished():
+            self.close()
             pyxel.quit()
 
+        # F1キー: ステップ数と描画フレーム数の表示
+        if pyxel.btnp(pyxel.KEY_F1):
+            self.show_stats = not self.show_stats
+
+        if self.replay is None and self.bot is None:
+            self.input.poll()
+
+        # 経過時間に応じて固定時間のステップを実行する（描画が遅れても速度を保つ）
+        now = time.perf_counter()
+        if self.last_time is None:
+            self.accumulator = STEP_TIME
+        else:
+            elapsed = now - self.last_time
+            # 表示間隔の揺らぎでステップ数が0と2を行き来しないように吸着させる
+            if abs(elapsed - STEP_TIME) < STEP_TIME * 0.1:
+                elapsed = STEP_TIME
+            self.accumulator += elapsed
+        self.last_time = now
+
+        steps = int(self.accumulator / STEP_TIME)
+        max_steps = self.max_frame_skip + 1
+        if steps > max_steps:
+            self.dropped_steps += steps - max_steps
+            steps = max_steps
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= steps * STEP_TIME
+
+        for _ in range(steps):
+            if self.replay_finished():
+                break
+            self.step()
+        self.update_ms = (time.perf_counter() - update_start) * 1000
+
+    def replay_finished(self):
+        return self.replay is not None and self.replay.finished
+
+    def close(self):
+        """入力とテレメトリの記録を終了する"""
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+        if self.telemetry is not None:
+            self.telemetry.close()
+            self.telemetry = None
+
+    def record_telemetry(self, frame, update_ms, draw_ms):
+        if self.telemetry is not None:
+            self.telemetry.write(
+                frame,
+                len(self.enemies),
+                len(self.player.bullets),
+                len(self.player.energy_balls),
+                len(self.effects),
+                update_ms,
+                draw_ms,
+                self.player.score,
+                self.player.health,
+            )
+
+    def step(self):
+        """シミュレーションを1ステップ進める"""
+        self.sim_steps += 1
+        if self.replay is not None:
+            self.replay.read(self.input)
+        elif self.bot is not None:
+            self.bot.act(self, self.input)
+        if self.recorder is not None:
+            self.recorder.write(self.input)
+
+        # Lボタン: チェックポイントの保存, Rボタン: チェックポイントからやり直し
+        if self.input.btnp(BUTTON_SAVE_CHECKPOINT) and not self.game_over:
+            self.checkpoint.save(self)
+        if self.input.btnp(BUTTON_LOAD_CHECKPOINT) and self.checkpoint.size > 0:
+            self.checkpoint.restore(self)
+
         if self.game_over:
-            if pyxel.btnp(pyxel.GAMEPAD1_BUTTON_A) or pyxel.btnp(pyxel.KEY_SPACE):
+            if self.input.btnp(BUTTON_RESTART):
                 self.reset_game()
+            self.input.consume()
             return
 
         self.update_player()
@@ -68,21 +1157,13 @@ class Game:
         self.update_projectiles()
         self.update_effects()
         self.check_collisions()
+        self.input.consume()
 
     def update_player(self):
-        # アナログスティックによる移動
-        lx = pyxel.btnv(pyxel.GAMEPAD1_AXIS_LEFTX)
-        ly = pyxel.btnv(pyxel.GAMEPAD1_AXIS_LEFTY)
-
-        # キーボード入力のサポート
-        if pyxel.btn(pyxel.KEY_LEFT) or pyxel.btn(pyxel.KEY_A):
-            lx = -32767
-        elif pyxel.btn(pyxel.KEY_RIGHT) or pyxel.btn(pyxel.KEY_D):
-            lx = 32767
-        if pyxel.btn(pyxel.KEY_UP) or pyxel.btn(pyxel.KEY_W):
-            ly = -32767
-        elif pyxel.btn(pyxel.KEY_DOWN) or pyxel.btn(pyxel.KEY_S):
-            ly = 32767
+        # アナログスティックによる移動（キーボード入力は InputState.poll で反映済み）
+        state = self.input
+        lx = state.left_x
+        ly = state.left_y
 
         # 移動速度の計算
         speed = self.player.dash_speed if self.player.dash_active else self.player.speed
@@ -92,8 +1173,8 @@ class Game:
             self.player.y += math.sin(angle) * speed
 
         # 画面端の制限
-        self.player.x = max(0, min(self.player.x, pyxel.width - self.player.size))
-        self.player.y = max(0, min(self.player.y, pyxel.height - self.player.size))
+        self.player.x = max(0, min(self.player.x, SCREEN_WIDTH - self.player.size))
+        self.player.y = max(0, min(self.player.y, SCREEN_HEIGHT - self.player.size))
 
         # ダッシュクールダウンの更新
         if self.player.dash_cooldown > 0:
@@ -106,47 +1187,45 @@ class Game:
                 self.player.power_mode = False
 
         # Aボタン: 通常攻撃（弾を発射）
-        if pyxel.btnp(pyxel.GAMEPAD1_BUTTON_A) or pyxel.btnp(pyxel.KEY_J):
-            rx = pyxel.btnv(pyxel.GAMEPAD1_AXIS_RIGHTX)
-            ry = pyxel.btnv(pyxel.GAMEPAD1_AXIS_RIGHTY)
+        if state.btnp(BUTTON_SHOOT):
+            rx = state.right_x
+            ry = state.right_y
             if abs(rx) > 10000 or abs(ry) > 10000:
                 angle = math.atan2(ry, rx)
             else:
                 angle = 0  # デフォルトは右向き
-            self.player.bullets.append(
-                {
-                    "x": self.player.x + self.player.size / 2,
-                    "y": self.player.y + self.player.size / 2,
-                    "angle": angle,
-                    "speed": 4,
-                }
+            self.player.bullets.add(
+                self.player.x + self.player.size / 2,
+                self.player.y + self.player.size / 2,
+                math.cos(angle) * BULLET_SPEED,
+                math.sin(angle) * BULLET_SPEED,
             )
 
         # Bボタン: ダッシュ
-        if (pyxel.btnp(pyxel.GAMEPAD1_BUTTON_B) or pyxel.btnp(pyxel.KEY_K)) and self.player.dash_cooldown <= 0:
+        if state.btnp(BUTTON_DASH) and self.player.dash_cooldown <= 0:
             self.player.dash_active = True
             self.player.dash_cooldown = 30
 
-        if not (pyxel.btn(pyxel.GAMEPAD1_BUTTON_B) or pyxel.btn(pyxel.KEY_K)):
+        if not state.btn(BUTTON_DASH):
             self.player.dash_active = False
 
         # Xボタン: シールド
-        self.player.shield_active = pyxel.btn(pyxel.GAMEPAD1_BUTTON_X) or pyxel.btn(pyxel.KEY_U)
+        self.player.shield_active = state.btn(BUTTON_SHIELD)
+
+        # BACKボタン: 敵の追跡方法の切り替え
+        if state.btnp(BUTTON_AI_MODE):
+            self.ai_mode = AI_MODE_FLOW if self.ai_mode == AI_MODE_DIRECT else AI_MODE_DIRECT
 
         # Yボタン: パワーモード
-        if pyxel.btnp(pyxel.GAMEPAD1_BUTTON_Y) or pyxel.btnp(pyxel.KEY_I):
+        if state.btnp(BUTTON_POWER):
             self.player.power_mode = True
             self.player.power_timer = 60
 
         # トリガー: エネルギーボール
-        if pyxel.btnv(pyxel.GAMEPAD1_AXIS_TRIGGERRIGHT) > 10000 or pyxel.btn(pyxel.KEY_E):
-            self.player.energy_balls.append(
-                {
-                    "x": self.player.x + self.player.size / 2,
-                    "y": self.player.y + self.player.size / 2,
-                    "size": 4,
-                    "growing": True,
-                }
+        if state.trigger_right > 10000 or state.btn(BUTTON_ENERGY):
+            self.player.energy_balls.add(
+                self.player.x + self.player.size / 2,
+                self.player.y + self.player.size / 2,
             )
 
     def update_enemies(self):
@@ -154,147 +1233,217 @@ class Game:
         self.spawn_timer += 1
         if self.spawn_timer >= 30:
             self.spawn_timer = 0
-            if random.random() < 0.3:
-                enemy_type = "elite" if random.random() < 0.2 else "normal"
-                x = random.choice([0, pyxel.width])
-                y = random.randint(0, pyxel.height - 8)
-                self.enemies.append(Enemy(x, y, enemy_type))
-
-        # 敵の移動
-        for enemy in self.enemies:
-            dx = self.player.x - enemy.x
-            dy = self.player.y - enemy.y
-            dist = math.sqrt(dx * dx + dy * dy)
-            if dist > 0:
-                enemy.x += (dx / dist) * enemy.speed
-                enemy.y += (dy / dist) * enemy.speed
+            if self.rng.random() < 0.3:
+                enemy_type = ENEMY_ELITE if self.rng.random() < 0.2 else ENEMY_NORMAL
+                x = self.rng.choice([0, SCREEN_WIDTH])
+                y = self.rng.randint(0, SCREEN_HEIGHT - 8)
+                self.enemies.add(x, y, health=ENEMY_HEALTH[enemy_type], type=enemy_type)
+
+        # 敵の移動（全ての敵をまとめてプレイヤーへ向ける）
+        n = self.enemies.count
+        if n == 0:
+            return
+        x = self.enemies.x[:n]
+        y = self.enemies.y[:n]
+        dx = self.player.x - x
+        dy = self.player.y - y
+        dist = np.sqrt(dx * dx + dy * dy)
+        moving = dist > 0
+        dist[~moving] = 1.0
+        speed = np.where(moving, ENEMY_SPEED[self.enemies.type[:n]], 0.0)
+        step_x = dx / dist
+        step_y = dy / dist
+
+        if self.ai_mode == AI_MODE_FLOW:
+            # フローフィールドの進行方向に従う（プレイヤーと同じセルでは直進）
+            self.flow_field.update(self.player.x, self.player.y)
+            flow_x, flow_y, at_goal = self.flow_field.sample(x, y)
+            step_x = np.where(at_goal, step_x, flow_x)
+            step_y = np.where(at_goal, step_y, flow_y)
+
+        x += step_x * speed
+        y += step_y * speed
 
     def update_projectiles(self):
-        # 弾の更新
-        for bullet in self.player.bullets[:]:
-            bullet["x"] += math.cos(bullet["angle"]) * bullet["speed"]
-            bullet["y"] += math.sin(bullet["angle"]) * bullet["speed"]
-            if bullet["x"] < 0 or bullet["x"] > pyxel.width or bullet["y"] < 0 or bullet["y"] > pyxel.height:
-                self.player.bullets.remove(bullet)
-
-        # エネルギーボールの更新
-        for ball in self.player.energy_balls[:]:
-            if ball["growing"]:
-                ball["size"] += 0.5
-                if ball["size"] >= 20:
-                    ball["growing"] = False
-            else:
-                ball["size"] -= 0.5
-                if ball["size"] <= 0:
-                    self.player.energy_balls.remove(ball)
+        # 弾の更新（移動と画面外の弾の削除をまとめて行う）
+        bullets = self.player.bullets
+        n = bullets.count
+        if n > 0:
+            x = bullets.x[:n]
+            y = bullets.y[:n]
+            x += bullets.vx[:n]
+            y += bullets.vy[:n]
+            bullets.compact((x >= 0) & (x <= SCREEN_WIDTH) & (y >= 0) & (y <= SCREEN_HEIGHT))
+
+        # エネルギーボールの更新（成長中は拡大し、最大サイズに達したら縮小して消える）
+        balls = self.player.energy_balls
+        n = balls.count
+        if n > 0:
+            size = balls.size[:n]
+            growing = balls.growing[:n]
+            size += np.where(growing, 0.5, -0.5)
+            growing &= size < ENERGY_BALL_MAX_SIZE
+            balls.compact(size > 0)
 
     def update_effects(self):
-        # エフェクトの更新
-        for effect in self.effects[:]:
-            effect["timer"] -= 1
-            if effect["timer"] <= 0:
-                self.effects.remove(effect)
+        # エフェクトの更新（表示時間が終わったものだけを取り除く）
+        self.effects.advance()
 
     def check_collisions(self):
-        # 弾と敵の衝突判定
-        for bullet in self.player.bullets[:]:
-            for enemy in self.enemies[:]:
-                if abs(bullet["x"] - enemy.x) < enemy.size and abs(bullet["y"] - enemy.y) < enemy.size:
-                    enemy.health -= 1
-                    if bullet in self.player.bullets:
-                        self.player.bullets.remove(bullet)
-                    if enemy.health <= 0:
-                        self.enemies.remove(enemy)
-                        self.player.score += 2 if enemy.type == "elite" else 1
-                    self.effects.append({"x": enemy.x, "y": enemy.y, "type": "hit", "timer": 5})
-                    break
-
-        # エネルギーボールと敵の衝突判定
-        for ball in self.player.energy_balls:
-            for enemy in self.enemies[:]:
-                if (
-                    abs(ball["x"] - enemy.x) < ball["size"] + enemy.size
-                    and abs(ball["y"] - enemy.y) < ball["size"] + enemy.size
-                ):
-                    enemy.health -= 0.1
-                    if enemy.health <= 0:
-                        self.enemies.remove(enemy)
-                        self.player.score += 2 if enemy.type == "elite" else 1
+        enemies = self.enemies
+        n = enemies.count
+        if n == 0:
+            return
+        # 敵の削除で配列が詰められるため、判定前の座標を複製しておく
+        ex = enemies.x[:n].copy()
+        ey = enemies.y[:n].copy()
+        health = enemies.health[:n].tolist()
+        alive = [True] * n
+
+        # 弾と敵の衝突判定（並び順で最初に重なった敵に命中）
+        if self.player.bullets.count > 0:
+            self.check_bullet_hits(ex, ey, health, alive)
+
+        enemies.health[:n] = health
+        alive = np.array(alive, dtype=bool)
+
+        # エネルギーボールと敵の衝突判定（強度マスクを敵ごとに1回参照する）
+        if self.player.energy_balls.count > 0:
+            self.coverage.rasterize(self.player.energy_balls)
+            health = enemies.health[:n]
+            health -= ENERGY_BALL_DAMAGE * self.coverage.sample(enemies.x[:n], enemies.y[:n])
+            killed = alive & (health <= 0)
+            if killed.any():
+                alive &= ~killed
+                self.player.score += int(np.take(ENEMY_SCORE, enemies.type[:n][killed]).sum())
+
+        if not alive.all():
+            enemies.compact(alive)
 
         # プレイヤーと敵の衝突判定
         if not self.player.shield_active and not self.player.power_mode:
-            for enemy in self.enemies:
-                if (
-                    abs(self.player.x - enemy.x) < (self.player.size + enemy.size) / 2
-                    and abs(self.player.y - enemy.y) < (self.player.size + enemy.size) / 2
-                ):
-                    self.player.health -= 10
-                    if self.player.health <= 0:
-                        self.game_over = True
-                    self.effects.append(
-                        {
-                            "x": self.player.x,
-                            "y": self.player.y,
-                            "type": "damage",
-                            "timer": 10,
-                        }
-                    )
+            px = self.player.x
+            py = self.player.y
+            reach = (self.player.size + ENEMY_SIZE) / 2
+            touching = alive & (np.abs(px - ex) < reach) & (np.abs(py - ey) < reach)
+            for _ in range(np.count_nonzero(touching)):
+                self.player.health -= 10
+                if self.player.health <= 0:
+                    self.game_over = True
+                self.effects.add(self.player.x, self.player.y, EFFECT_DAMAGE)
+
+    def check_bullet_hits(self, ex, ey, health, alive):
+        """弾と敵の衝突判定。各弾は並び順で最初に重なった生きている敵に命中する
+
+        重なっている (弾, 敵) の組を配列演算でまとめて求め、命中の処理だけを弾の順に1つずつ行う。
+        組が少なければ全組み合わせを判定し、多ければ空間ハッシュで近傍セルの敵に絞る。
+        health と alive は敵ごとのリストで、命中に応じて更新する。
+        """
+        bullets = self.player.bullets
+        bullet_count = bullets.count
+        bx = bullets.x[:bullet_count]
+        by = bullets.y[:bullet_count]
+        n = len(ex)
+
+        # 組を弾の順、同じ弾の中では敵のインデックスの順に並べて求める
+        if bullet_count * n <= BRUTE_FORCE_MAX_PAIRS:
+            overlap = (np.abs(bx[:, None] - ex) < ENEMY_SIZE) & (np.abs(by[:, None] - ey) < ENEMY_SIZE)
+            pair_bullets, pair_enemies = np.nonzero(overlap)
+        else:
+            grid = self.enemy_grid
+            grid.rebuild(ex, ey)
+            pair_bullets, pair_enemies = grid.query_pairs(
+                bx - ENEMY_SIZE, by - ENEMY_SIZE, bx + ENEMY_SIZE, by + ENEMY_SIZE
+            )
+            overlap = (np.abs(bx[pair_bullets] - ex[pair_enemies]) < ENEMY_SIZE) & (
+                np.abs(by[pair_bullets] - ey[pair_enemies]) < ENEMY_SIZE
+            )
+            pair_bullets, pair_enemies = np.divmod(np.sort(pair_bullets[overlap] * n + pair_enemies[overlap]), n)
+        if len(pair_enemies) == 0:
+            return
+
+        # 弾ごとに、重なっている敵のうち生きている最初の敵に命中させる
+        pair_enemies = pair_enemies.tolist()
+        starts = np.flatnonzero(np.diff(pair_bullets, prepend=-1))
+        ends = np.append(starts[1:], len(pair_enemies))
+        bullet_hit = np.zeros(bullet_count, dtype=bool)
+        for b, start, end in zip(pair_bullets[starts].tolist(), starts.tolist(), ends.tolist()):
+            target = next((i for i in pair_enemies[start:end] if alive[i]), -1)
+            if target < 0:
+                continue
+
+            bullet_hit[b] = True
+            health[target] -= 1
+            if health[target] <= 0:
+                alive[target] = False
+                self.player.score += ENEMY_SCORE[self.enemies.type[target]]
+            self.effects.add(float(ex[target]), float(ey[target]), EFFECT_HIT)
+        if bullet_hit.any():
+            bullets.compact(~bullet_hit)
 
     def draw(self):
+        draw_start = time.perf_counter()
+        self.rendered_frames += 1
+        self.draw_scene()
+        self.record_telemetry(self.rendered_frames, self.update_ms, (time.perf_counter() - draw_start) * 1000)
+
+    def draw_scene(self):
         pyxel.cls(0)
 
         if self.game_over:
             pyxel.text(60, 50, "GAME OVER", 8)  # 赤色
             pyxel.text(45, 60, f"SCORE: {self.player.score}", 10)  # 黄色
             pyxel.text(35, 70, "PRESS A TO RESTART", 7)  # 白色
+            if self.checkpoint.size > 0:
+                pyxel.text(18, 80, "PRESS RB/F9 TO RETRY CHECKPOINT", 7)  # 白色
             return
 
+        atlas = self.atlas
+
         # プレイヤーの描画
         player_color = self.player.color
         if self.player.power_mode and pyxel.frame_count % 4 < 2:
-            player_color = 10  # 黄色
-        pyxel.tri(
-            self.player.x,
-            self.player.y + self.player.size,
-            self.player.x + self.player.size,
-            self.player.y + self.player.size / 2,
-            self.player.x,
-            self.player.y,
-            player_color,
-        )
+            player_color = PLAYER_COLORS[1]
+        atlas.draw(("player", player_color), self.player.x, self.player.y)
 
         # シールドの描画
         if self.player.shield_active:
-            pyxel.circb(
+            atlas.draw_ring(
                 self.player.x + self.player.size / 2,
                 self.player.y + self.player.size / 2,
-                10,
+                SHIELD_RADIUS,
                 12,  # 水色
             )
 
         # 弾の描画
-        for bullet in self.player.bullets:
-            pyxel.rect(bullet["x"] - 1, bullet["y"] - 1, 2, 2, 10)  # 黄色
+        bullets = self.player.bullets
+        for bx, by in zip(bullets.x[: bullets.count].tolist(), bullets.y[: bullets.count].tolist()):
+            pyxel.rect(bx - 1, by - 1, 2, 2, 10)  # 黄色
 
         # エネルギーボールの描画
-        for ball in self.player.energy_balls:
-            pyxel.circb(
-                ball["x"],
-                ball["y"],
-                int(ball["size"]),
-                8 if ball["growing"] else 9,  # 赤または橙色
-            )
+        balls = self.player.energy_balls
+        n = balls.count
+        for bx, by, size, growing in zip(
+            balls.x[:n].tolist(), balls.y[:n].tolist(), balls.size[:n].tolist(), balls.growing[:n].tolist()
+        ):
+            atlas.draw_ring(bx, by, int(size), 8 if growing else 9)  # 赤または橙色
 
         # 敵の描画
-        for enemy in self.enemies:
-            pyxel.rect(enemy.x, enemy.y, enemy.size, enemy.size, enemy.color)
+        n = self.enemies.count
+        enemy_keys = [("enemy", enemy_type) for enemy_type in range(len(ENEMY_COLOR))]
+        for ex, ey, enemy_type in zip(
+            self.enemies.x[:n].tolist(), self.enemies.y[:n].tolist(), self.enemies.type[:n].tolist()
+        ):
+            atlas.draw(enemy_keys[enemy_type], ex, ey)
 
         # エフェクトの描画
-        for effect in self.effects:
-            if effect["type"] == "hit":
-                pyxel.circb(effect["x"], effect["y"], 10 - effect["timer"], 10)  # 黄色
-            elif effect["type"] == "damage":
-                pyxel.circb(effect["x"], effect["y"], effect["timer"], 8)  # 赤色
+        effects = self.effects
+        for slot in effects.live:
+            timer = effects.timer(slot)
+            if effects.type[slot] == EFFECT_HIT:
+                atlas.draw_ring(effects.x[slot], effects.y[slot], 10 - timer, 10)  # 黄色
+            else:
+                atlas.draw_ring(effects.x[slot], effects.y[slot], timer, 8)  # 赤色
 
         # UI表示
         pyxel.text(5, 5, f"SCORE: {self.player.score}", 10)  # 黄色
@@ -307,6 +1456,166 @@ class Game:
         if self.player.power_mode:
             pyxel.text(5, 35, "POWER MODE!", 10)  # 黄色
 
+        if self.ai_mode == AI_MODE_FLOW:
+            pyxel.text(5, pyxel.height - 10, "AI: FLOW FIELD", 13)  # 灰色
+
+        if self.show_stats:
+            self.draw_stats()
+
+    def draw_stats(self):
+        """シミュレーションのステップ数と描画フレーム数を表示する"""
+        pyxel.text(80, 5, f"STEP {self.sim_steps}", 13)
+        pyxel.text(80, 12, f"DRAW {self.rendered_frames}", 13)
+        pyxel.text(80, 19, f"DROP {self.dropped_steps}", 13)
+
+    def state_digest(self):
+        """リプレイ結果の比較用に、ゲーム状態のハッシュ値を返す"""
+        digest = hashlib.sha1()
+        player = self.player
+        digest.update(
+            repr((player.x, player.y, player.health, player.score, self.spawn_timer, self.game_over)).encode()
+        )
+        for store in (player.bullets, player.energy_balls, self.enemies):
+            for name, _ in store.FIELDS:
+                digest.update(getattr(store, name)[: store.count].tobytes())
+        return digest.hexdigest()
+
+
+def run_headless(replay, telemetry_path=None):
+    """リプレイをウィンドウ無しで最速で再生し、結果を表示する"""
+    game = Game(headless=True, replay=replay, telemetry_path=telemetry_path)
+    start = time.perf_counter()
+    while not replay.finished:
+        t0 = time.perf_counter()
+        game.step()
+        game.record_telemetry(game.sim_steps, (time.perf_counter() - t0) * 1000, 0.0)
+    elapsed = time.perf_counter() - start
+    game.close()
+
+    print(f"steps: {game.sim_steps}")
+    elapsed = max(elapsed, 1e-9)
+    speedup = game.sim_steps * STEP_TIME / elapsed
+    print(f"time: {elapsed:.3f}s ({game.sim_steps / elapsed:.0f} steps/s, x{speedup:.1f} realtime)")
+    print(f"score: {game.player.score} health: {game.player.health} game over: {game.game_over}")
+    balls = len(game.player.energy_balls)
+    print(f"enemies: {len(game.enemies)} bullets: {len(game.player.bullets)} energy balls: {balls}")
+    print(f"digest: {game.state_digest()}")
+    return game
+
+
+def run_bot(games, max_steps, seed=0, ai_mode=AI_MODE_DIRECT, spike_ms=5.0, telemetry_path=None):
+    """自動操作で指定回数のゲームをウィンドウ無しで連続実行し、負荷の統計を表示する"""
+    game = Game(headless=True, seed=seed, ai_mode=ai_mode, bot=BotController(seed), telemetry_path=telemetry_path)
+    step_times = []
+    spikes = []
+    peaks = {"enemies": 0, "bullets": 0, "energy balls": 0, "effects": 0}
+    totals = dict.fromkeys(peaks, 0)
+    scores = []
+
+    start = time.perf_counter()
+    for game_index in range(games):
+        steps = 0
+        while steps < max_steps:
+            t0 = time.perf_counter()
+            game.step()
+            step_ms = (time.perf_counter() - t0) * 1000
+            steps += 1
+            game.record_telemetry(game.sim_steps, step_ms, 0.0)
+            step_times.append(step_ms)
+            if step_ms > spike_ms:
+                spikes.append((step_ms, game_index, steps))
+
+            counts = {
+                "enemies": len(game.enemies),
+                "bullets": len(game.player.bullets),
+                "energy balls": len(game.player.energy_balls),
+                "effects": len(game.effects),
+            }
+            for name, count in counts.items():
+                peaks[name] = max(peaks[name], count)
+                totals[name] += count
+
+            if game.game_over:
+                break
+        scores.append(game.player.score)
+        # 次のゲームへ（ゲームオーバーにならなかった場合も打ち切ってリセット）
+        game.reset_game()
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    game.close()
+
+    total_steps = len(step_times)
+    ordered = sorted(step_times)
+    print(f"games: {games} steps: {total_steps}")
+    print(f"time: {elapsed:.2f}s ({total_steps / elapsed:.0f} steps/s)")
+    print(f"score: mean {sum(scores) / len(scores):.1f} max {max(scores)}")
+    print(
+        "step ms: "
+        f"p50 {ordered[total_steps // 2]:.3f} "
+        f"p99 {ordered[min(total_steps - 1, total_steps * 99 // 100)]:.3f} "
+        f"max {ordered[-1]:.3f}"
+    )
+    for name, peak in peaks.items():
+        print(f"{name}: mean {totals[name] / total_steps:.1f} peak {peak}")
+    print(f"spikes over {spike_ms}ms: {len(spikes)}")
+    for step_ms, game_index, step in sorted(spikes, reverse=True)[:10]:
+        print(f"  {step_ms:.2f}ms at game {game_index} step {step}")
+
+
+def seed_value(text):
+    """--seed の値を、リプレイのヘッダに書ける 0 以上 2**32 未満の整数として読む"""
+    seed = int(text)
+    if not 0 <= seed < 2**32:
+        raise argparse.ArgumentTypeError(f"seed must be between 0 and {2**32 - 1}: {text}")
+    return seed
+
+
+def positive_int(text):
+    """--games / --max-steps の値を1以上の整数として読む"""
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer: {text}")
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A Pyxel simple action game")
+    parser.add_argument("--ai", choices=(AI_MODE_DIRECT, AI_MODE_FLOW), default=AI_MODE_DIRECT, help="enemy AI mode")
+    parser.add_argument("--seed", type=seed_value, help="random seed for enemy spawns")
+    parser.add_argument("--record", metavar="PATH", help="record inputs to a replay file")
+    parser.add_argument("--replay", metavar="PATH", help="play back a replay file")
+    parser.add_argument("--bot", action="store_true", help="let the built-in bot play")
+    parser.add_argument("--games", type=positive_int, default=100, help="number of games for --bot --headless")
+    parser.add_argument(
+        "--max-steps", type=positive_int, default=FPS * 600, help="step limit per game for --bot --headless"
+    )
+    parser.add_argument("--headless", action="store_true", help="run --replay or --bot without a window")
+    parser.add_argument("--telemetry", metavar="PATH", help="write per-frame telemetry records")
+    parser.add_argument("--telemetry-summary", metavar="PATH", help="summarize a telemetry file and exit")
+    args = parser.parse_args()
+
+    if args.telemetry_summary:
+        summarize_telemetry(args.telemetry_summary)
+        return
+
+    replay = InputReplay(args.replay) if args.replay else None
+    if args.headless:
+        if replay is not None:
+            run_headless(replay, args.telemetry)
+        elif args.bot:
+            run_bot(args.games, args.max_steps, args.seed or 0, args.ai, telemetry_path=args.telemetry)
+        else:
+            parser.error("--headless requires --replay or --bot")
+    else:
+        bot = BotController(args.seed or 0) if args.bot else None
+        Game(
+            ai_mode=args.ai,
+            seed=args.seed,
+            record_path=args.record,
+            replay=replay,
+            bot=bot,
+            telemetry_path=args.telemetry,
+        )
+
 
 if __name__ == "__main__":
-    Game()
+    main()
@@ -0,0 +1,91 @@
+"""入力状態の一覧をオフスクリーン画像に保持して描画する保持型（retained）パネル
+
+ラベルは起動時に1回だけ画像へ描いておき、毎フレームは状態が変わった行だけを描き直す。
+draw は画像を1回 blt するだけなので、他のアプリの上にオーバーレイとして重ねても負荷が小さい。
+"""
+
+from array import array
+
+import pyxel
+
+
+class InputPanel:
+    """InputLayer の状態を行ごとにキャッシュし、変化した行だけ画像へ描き直す"""
+
+    def __init__(
+        self,
+        input_layer,
+        analog_inputs,
+        digital_inputs,
+        width,
+        line_height=10,
+        color_inactive=7,
+        color_active=10,
+        char_width=pyxel.FONT_WIDTH,
+    ):
+        self.input = input_layer
+        self.width = width
+        self.line_height = line_height
+        self.color_inactive = color_inactive
+        self.color_active = color_active
+        self.char_width = char_width
+
+        self.analog_names = [input_name for input_name, _ in analog_inputs]
+        self.digital_names = [input_name for input_name, _ in digital_inputs]
+        # デジタル入力の行は文字列が変わらないので起動時に作っておく
+        self.digital_labels = [
+            input_name + f" ({'+'.join([str(k) for k in keyboard_keys])})"
+            for input_name, keyboard_keys in digital_inputs
+        ]
+
+        # 前回描いた状態（アナログは値、デジタルは押下状態）。-1 は未描画を表す
+        self.analog_cache = array("i", [0] * len(self.analog_names))
+        self.digital_cache = array("b", [-1] * len(self.digital_names))
+
+        self.height = (len(self.analog_names) + len(self.digital_names)) * line_height
+        self.image = pyxel.Image(width, self.height)
+        self.image.cls(0)
+
+        # 静的なラベルを1回だけ描く
+        for i, input_name in enumerate(self.analog_names):
+            self.draw_row(i, f"{input_name} 0", color_inactive)
+        for i, label in enumerate(self.digital_labels):
+            self.draw_row(len(self.analog_names) + i, label, color_inactive)
+            self.digital_cache[i] = 0
+
+    def draw_row(self, row, text, color):
+        """1行分を消してから中央揃えでテキストを描く"""
+        y = row * self.line_height
+        self.image.rect(0, y, self.width, self.line_height, 0)
+        x = (self.width - len(text) * self.char_width) // 2
+        self.image.text(x, y, text, color)
+
+    def update(self):
+        """前回から状態が変わった行だけを描き直す。描き直した行数を返す"""
+        redrawn = 0
+
+        for i, input_name in enumerate(self.analog_names):
+            value = self.input.value(input_name)
+            if value != self.analog_cache[i]:
+                self.analog_cache[i] = value
+                color = self.color_active if value != 0 else self.color_inactive
+                self.draw_row(i, f"{input_name} {value}", color)
+                redrawn += 1
+
+        row = len(self.analog_names)
+        for i, input_name in enumerate(self.digital_names):
+            is_pressed = self.input.is_pressed(input_name)
+            if is_pressed != self.digital_cache[i]:
+                self.digital_cache[i] = is_pressed
+                color = self.color_active if is_pressed else self.color_inactive
+                self.draw_row(row + i, self.digital_labels[i], color)
+                redrawn += 1
+
+        return redrawn
+
+    def draw(self, x, y, colkey=None):
+        """パネルを画面へ転送する。オーバーレイにする場合は colkey=0 を指定する"""
+        if colkey is None:
+            pyxel.blt(x, y, self.image, 0, 0, self.width, self.height)
+        else:
+            pyxel.blt(x, y, self.image, 0, 0, self.width, self.height, colkey)
@@ -6,6 +6,122 @@
 # version: 1.0
 
 import pyxel
+import math
+import time
+from array import array
+
+from common.input_layer import InputLayer
+from common.input_panel import InputPanel
+
+# 表示モード（TABキーで順番に切り替え）
+MODE_INPUT = 0
+MODE_LATENCY = 1
+MODE_HISTORY = 2
+MODE_COUNT = 3
+
+# レイテンシ計測の設定
+LATENCY_BIN_MS = 0.1  # ヒストグラムのビン幅（ミリ秒）
+LATENCY_BINS = 400  # 0〜40ミリ秒。これを超えた値は最後のビンに入れる
+LATENCY_MARKER_SIZE = 16  # 押下時に点滅させるマーカーの大きさ
+
+# アナログ入力の履歴の設定
+HISTORY_SIZE = 512  # 保持するフレーム数
+HISTORY_DEADZONE = 4096  # この絶対値未満をデッドゾーン内とみなす
+HISTORY_FPS = 30  # pyxel.init の既定のフレームレート
+
+
+class AxisHistory:
+    """アナログ軸1本分の値を固定長のリングバッファに記録し、統計を差分で更新する
+
+    バッファは起動時に確保し、毎フレームの記録では新しい配列を作らない。
+    """
+
+    def __init__(self):
+        self.values = array("i", [0] * HISTORY_SIZE)
+        self.changed = bytearray(HISTORY_SIZE)  # 直前のサンプルから値が変わったか
+        self.head = 0  # 次に書き込む位置
+        self.count = 0
+        self.change_count = 0  # 窓内で値が変わった回数
+        self.dead_count = 0  # 窓内でデッドゾーンに入っていたサンプル数
+        self.dead_sum = 0
+        self.dead_sum_sq = 0
+
+    def add(self, value):
+        values = self.values
+        head = self.head
+        last = values[head - 1]  # head が 0 のときは末尾（直前のサンプル）を指す
+
+        # 上書きされる最古のサンプルを統計から取り除く
+        if self.count == HISTORY_SIZE:
+            self.change_count -= self.changed[head]
+            old = values[head]
+            if -HISTORY_DEADZONE < old < HISTORY_DEADZONE:
+                self.dead_count -= 1
+                self.dead_sum -= old
+                self.dead_sum_sq -= old * old
+        else:
+            self.count += 1
+
+        changed = 1 if value != last else 0
+        self.changed[head] = changed
+        self.change_count += changed
+        if -HISTORY_DEADZONE < value < HISTORY_DEADZONE:
+            self.dead_count += 1
+            self.dead_sum += value
+            self.dead_sum_sq += value * value
+
+        values[head] = value
+        self.head = (head + 1) % HISTORY_SIZE
+
+    def sample(self, age):
+        """age フレーム前の値を返す（0が最新）"""
+        return self.values[(self.head - 1 - age) % HISTORY_SIZE]
+
+    def update_rate(self):
+        """値が更新された頻度（Hz）。スティックの実効サンプリングレートの目安になる"""
+        return self.change_count * HISTORY_FPS / self.count if self.count else 0.0
+
+    def deadzone_stats(self):
+        """デッドゾーン内の割合・平均（中立位置のずれ）・標準偏差（ノイズ）を返す"""
+        if self.dead_count == 0:
+            return 0.0, 0.0, 0.0
+        mean = self.dead_sum / self.dead_count
+        noise = math.sqrt(max(self.dead_sum_sq / self.dead_count - mean * mean, 0.0))
+        return self.dead_count / self.count, mean, noise
+
+
+class LatencyHistogram:
+    """ボタン1つ分のレイテンシを固定幅のヒストグラムで集計する"""
+
+    def __init__(self):
+        self.bins = [0] * LATENCY_BINS
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.min_ms = math.inf
+
+    def add(self, ms):
+        index = min(int(ms / LATENCY_BIN_MS), LATENCY_BINS - 1)
+        self.bins[index] += 1
+        self.count += 1
+        self.total += ms
+        self.total_sq += ms * ms
+        self.min_ms = min(self.min_ms, ms)
+
+    def percentile(self, ratio):
+        """ヒストグラムを累積してパーセンタイルを求める（ビンの中央値を返す）"""
+        target = ratio * self.count
+        cumulative = 0
+        for index, n in enumerate(self.bins):
+            cumulative += n
+            if cumulative >= target:
+                return (index + 0.5) * LATENCY_BIN_MS
+        return (LATENCY_BINS - 0.5) * LATENCY_BIN_MS
+
+    def jitter(self):
+        """標準偏差をジッターとして返す"""
+        mean = self.total / self.count
+        return math.sqrt(max(self.total_sq / self.count - mean * mean, 0.0))
 
 
 class GamepadChecker:
@@ -52,57 +168,159 @@ class GamepadChecker:
             ("GAMEPAD1_BUTTON_DPAD_RIGHT", [pyxel.KEY_RIGHT]),  # →キー
         ]
 
+        # 入力レイヤー（全ての入力を1フレームに1回だけ読み取る）
+        self.input = InputLayer(self.analog_inputs, self.digital_inputs)
+
+        # 入力一覧は保持型パネルに描き、変化した行だけを更新する（文字幅8は従来の配置に合わせたもの）
+        self.panel = InputPanel(
+            self.input,
+            self.analog_inputs,
+            self.digital_inputs,
+            self.SCREEN_WIDTH,
+            self.line_height,
+            self.COLOR_INACTIVE,
+            self.COLOR_ACTIVE,
+            char_width=8,
+        )
+
+        self.mode = MODE_INPUT
+
+        # レイテンシ計測
+        # update の先頭で押下を検出した時刻から、マーカーを描き終えた draw の終わりまでを計測する
+        # （画面への転送は draw の後に pyxel が行うので、update と draw の処理時間を含む）
+        self.prev_pressed = [False] * len(self.digital_inputs)  # 表示モードに関係なく毎フレーム更新する
+        self.press_time = [None] * len(self.digital_inputs)  # 押下を検出した時刻
+        self.histograms = [LatencyHistogram() for _ in self.digital_inputs]
+
+        # アナログ入力の履歴（表示モードに関係なく毎フレーム記録する）
+        self.histories = [AxisHistory() for _ in self.analog_inputs]
+
         pyxel.run(self.update, self.draw)
 
     def update(self):
-        # STARTボタンまたはESCキーで終了
-        if pyxel.btn(pyxel.GAMEPAD1_BUTTON_START) or pyxel.btn(pyxel.KEY_ESCAPE):
-            pyxel.quit()
+        self.input.poll()
+        now = time.perf_counter()
+
+        for history, (input_name, _) in zip(self.histories, self.analog_inputs):
+            history.add(self.input.value(input_name))
 
-    def get_analog_value(self, input_name, keyboard_keys):
-        """アナログ入力値の取得（キーボードの場合は最大値を返す）"""
-        value = pyxel.btnv(getattr(pyxel, input_name))
+        self.detect_presses(now)
 
-        # キーボード入力のチェック
-        if len(keyboard_keys) == 2:  # 左右/上下の場合
-            if pyxel.btn(keyboard_keys[0]):  # 正の値
-                value = 32767
-            elif pyxel.btn(keyboard_keys[1]):  # 負の値
-                value = -32768
-        elif len(keyboard_keys) == 1:  # トリガーの場合
-            if pyxel.btn(keyboard_keys[0]):
-                value = 32767
+        if pyxel.btnp(pyxel.KEY_TAB):
+            self.mode = (self.mode + 1) % MODE_COUNT
+            self.press_time = [None] * len(self.digital_inputs)
 
-        return value
+        # STARTボタンまたはESCキーで終了
+        if pyxel.btn(pyxel.GAMEPAD1_BUTTON_START) or pyxel.btn(pyxel.KEY_ESCAPE):
+            pyxel.quit()
 
-    def is_button_pressed(self, input_name, keyboard_keys):
-        """ボタンの押下状態を取得"""
-        return pyxel.btn(getattr(pyxel, input_name)) or any(pyxel.btn(key) for key in keyboard_keys)
+    def detect_presses(self, now):
+        """ボタンの押下状態を更新し、レイテンシモードでは新しい押下の時刻を記録する"""
+        for i, (input_name, _) in enumerate(self.digital_inputs):
+            is_pressed = self.input.is_pressed(input_name)
+            if self.mode == MODE_LATENCY and is_pressed and not self.prev_pressed[i]:
+                self.press_time[i] = now
+            self.prev_pressed[i] = is_pressed
 
     def draw(self):
         pyxel.cls(0)
 
+        if self.mode == MODE_LATENCY:
+            self.draw_latency()
+            return
+        if self.mode == MODE_HISTORY:
+            self.draw_history()
+            return
+
         # タイトルの表示
         title = "GAMEPAD1 INPUT TEST (Press START or ESC to exit)"
         self.draw_centered_text(title, self.title_y, self.COLOR_INACTIVE)
+        pyxel.text(4, self.SCREEN_HEIGHT - 10, "TAB: latency / history mode", self.COLOR_INACTIVE)
 
-        current_y = self.start_y
+        # アナログ入力とデジタル入力の表示
+        self.panel.update()
+        self.panel.draw(0, self.start_y)
 
-        # アナログ入力の表示
-        for input_name, keyboard_keys in self.analog_inputs:
-            value = self.get_analog_value(input_name, keyboard_keys)
-            color = self.COLOR_ACTIVE if value != 0 else self.COLOR_INACTIVE
-            self.draw_centered_text(f"{input_name} {value}", current_y, color)
-            current_y += self.line_height
+    def draw_latency(self):
+        """押下マーカーとボタンごとのレイテンシ統計を表示する"""
+        self.draw_centered_text("LATENCY MODE (TAB: next mode)", self.title_y, self.COLOR_INACTIVE)
+        pyxel.text(4, self.start_y - 10, "BUTTON        N   MIN   MED   P99  JIT (ms)", self.COLOR_INACTIVE)
 
-        # デジタル入力の表示
-        for input_name, keyboard_keys in self.digital_inputs:
-            is_pressed = self.is_button_pressed(input_name, keyboard_keys)
-            color = self.COLOR_ACTIVE if is_pressed else self.COLOR_INACTIVE
-            key_info = f" ({'+'.join([str(k) for k in keyboard_keys])})"
-            self.draw_centered_text(input_name + key_info, current_y, color)
+        current_y = self.start_y
+        for i, (input_name, _) in enumerate(self.digital_inputs):
+            histogram = self.histograms[i]
+            label = input_name.replace("GAMEPAD1_BUTTON_", "")
+            if histogram.count > 0:
+                stats = (
+                    f"{histogram.min_ms:5.1f} {histogram.percentile(0.5):5.1f} "
+                    f"{histogram.percentile(0.99):5.1f} {histogram.jitter():4.1f}"
+                )
+            else:
+                stats = "    -     -     -    -"
+            color = self.COLOR_ACTIVE if self.press_time[i] is not None else self.COLOR_INACTIVE
+            pyxel.text(4, current_y, f"{label:<12}{histogram.count:3d} {stats}", color)
             current_y += self.line_height
 
+        # 押下を検出したフレームでマーカーを点滅させる
+        pending = [i for i, press_time in enumerate(self.press_time) if press_time is not None]
+        if not pending:
+            return
+        pyxel.rect(
+            self.SCREEN_WIDTH - LATENCY_MARKER_SIZE,
+            self.SCREEN_HEIGHT - LATENCY_MARKER_SIZE,
+            LATENCY_MARKER_SIZE,
+            LATENCY_MARKER_SIZE,
+            self.COLOR_ACTIVE,
+        )
+
+        # マーカーを描き終えた時刻までをレイテンシとして記録する（draw の最後の処理）
+        presented = time.perf_counter()
+        for i in pending:
+            self.histograms[i].add((presented - self.press_time[i]) * 1000)
+            self.press_time[i] = None
+
+    def draw_history(self):
+        """各アナログ軸の履歴をスクロールするグラフと統計で表示する"""
+        self.draw_centered_text("HISTORY MODE (TAB: next mode)", self.title_y, self.COLOR_INACTIVE)
+
+        graph_height = (self.SCREEN_HEIGHT - self.start_y) // len(self.analog_inputs)
+        plot_height = graph_height - 12
+        samples_per_x = HISTORY_SIZE // self.SCREEN_WIDTH
+        top = self.start_y
+
+        for history, (input_name, _) in zip(self.histories, self.analog_inputs):
+            ratio, mean, noise = history.deadzone_stats()
+            label = input_name.replace("GAMEPAD1_AXIS_", "")
+            pyxel.text(
+                4,
+                top,
+                f"{label:<12}{history.update_rate():5.1f}Hz DZ {ratio * 100:3.0f}% OFS {mean:6.0f} NOISE {noise:5.0f}",
+                self.COLOR_INACTIVE,
+            )
+
+            # 中心線とデッドゾーンの範囲
+            plot_top = top + 8
+            center = plot_top + plot_height // 2
+            scale = plot_height / 65536
+            dead = int(HISTORY_DEADZONE * scale)
+            pyxel.rect(0, center - dead, self.SCREEN_WIDTH, dead * 2 + 1, 1)
+            pyxel.line(0, center, self.SCREEN_WIDTH - 1, center, 5)
+
+            # 1列に samples_per_x 個のサンプルをまとめ、最小値から最大値までを縦線で描く（右端が最新）
+            age = 0
+            for x in range(self.SCREEN_WIDTH - 1, -1, -1):
+                if age >= history.count:
+                    break
+                low = high = history.sample(age)
+                for offset in range(1, samples_per_x):
+                    value = history.sample(age + offset)
+                    low = min(low, value)
+                    high = max(high, value)
+                age += samples_per_x
+                pyxel.line(x, center - int(high * scale), x, center - int(low * scale), self.COLOR_ACTIVE)
+
+            top += graph_height
+
     def draw_centered_text(self, text, y, color):
         """画面中央にテキストを表示する"""
         x = (self.SCREEN_WIDTH - len(text) * 8) // 2  # 8はフォントの幅
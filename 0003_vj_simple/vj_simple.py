@@ -7,6 +7,54 @@
 
 import pyxel
 import math
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from common.fast_trig import table as trig
+from common.input_layer import InputLayer
+
+# フレームキャッシュの設定
+FRAME_CACHE_BYTES = 64 * 1024 * 1024  # キャッシュに使うメモリの上限（1画素1バイト）
+ROTATION_STEPS = 360  # 回転角度を1周あたり何段階に量子化するか
+SCALE_STEP = 0.02  # スケールを量子化する刻み
+
+# 内部解像度の設定
+RENDER_SCALES = (1, 2, 4)  # 画面に対する縮小率（2なら256x256で描いて2倍に拡大する）
+RENDER_BUDGET_MS = 20.0  # 自動切り替え時の描画時間の予算
+RENDER_HOLD_FRAMES = 30  # 切り替えた後、次の切り替えを判断するまで待つフレーム数
+
+
+class FrameCache:
+    """量子化したパラメータをキーに、描画済みのフレームを LRU で保持する"""
+
+    def __init__(self, width, height, max_bytes=FRAME_CACHE_BYTES):
+        self.width = width
+        self.height = height
+        self.capacity = max(1, max_bytes // (width * height))
+        self.frames = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """キャッシュ済みの画像を返す。無ければ None"""
+        image = self.frames.get(key)
+        if image is None:
+            self.misses += 1
+            return None
+        self.frames.move_to_end(key)
+        self.hits += 1
+        return image
+
+    def store(self, key):
+        """現在の画面をキャッシュに保存する。上限に達したら最も古いフレームの画像を再利用する"""
+        if len(self.frames) >= self.capacity:
+            _, image = self.frames.popitem(last=False)
+        else:
+            image = pyxel.Image(self.width, self.height)
+        image.blt(0, 0, pyxel.screen, 0, 0, self.width, self.height)
+        self.frames[key] = image
 
 
 class VJSimple:
@@ -18,12 +66,28 @@ class VJSimple:
         # サウンドの初期化
         self.init_sound()
 
+        # パターンの基本形状
+        self.init_shapes()
+
         # パターンの状態
         self.pattern_type = 0  # パターンの種類
         self.rotation = 0  # 回転角度
         self.scale = 1.0  # スケール
         self.color = 7  # 色
         self.beat = False  # ビート状態
+        self.frame_cache = None  # フレームキャッシュ（Cキーで有効化）
+
+        # 内部解像度（Rキーで 1x → 1/2 → 1/4 → 自動 の順に切り替え）
+        self.render_scale = 1
+        self.render_auto = False
+        self.render_ms = 0.0  # 描画時間の移動平均
+        self.render_hold = 0
+        self.canvas = pyxel  # 描画先（等倍なら画面、縮小時はオフスクリーン画像）
+        self.canvases = {
+            scale: pyxel.Image(self.SCREEN_WIDTH // scale, self.SCREEN_HEIGHT // scale)
+            for scale in RENDER_SCALES
+            if scale > 1
+        }
 
         # アナログ入力とキーボード対応
         self.analog_inputs = [
@@ -41,8 +105,58 @@ class VJSimple:
             ("GAMEPAD1_BUTTON_Y", [pyxel.KEY_I]),  # サウンド3
         ]
 
+        # 入力レイヤー（全ての入力を1フレームに1回だけ読み取る）
+        self.input = InputLayer(self.analog_inputs, self.digital_inputs)
+
         pyxel.run(self.update, self.draw)
 
+    def init_shapes(self):
+        """各パターンの基本形状（回転0、スケール1）の頂点配列を事前に計算する
+
+        描画時は頂点配列全体に回転・拡大・平行移動を1回かけるだけで済む。
+        *_next は各頂点から線を引く先の頂点、*_color は色のずらし量を表す。
+        """
+        # 星: 外側と内側の頂点を交互に並べた10頂点の閉じた線
+        num_points = 5
+        index = np.arange(num_points * 2)
+        angles = index * math.pi / num_points
+        radii = 100 * np.where(index % 2, 0.5, 1.0)
+        self.star_x = np.cos(angles) * radii
+        self.star_y = np.sin(angles) * radii
+        self.star_next = np.roll(index, -1)
+        self.star_color = np.zeros(len(index), dtype=int)
+
+        # 同心円: 8本 × 32頂点の閉じた線
+        num_circles = 8
+        steps = 32
+        ring_angles = np.arange(steps) * math.pi * 2 / steps
+        ring_next = np.roll(np.arange(steps), -1)
+        radii = (np.arange(num_circles)[:, None] + 1) * 20
+        self.circles_x = (np.cos(ring_angles) * radii).ravel()
+        self.circles_y = (np.sin(ring_angles) * radii).ravel()
+        self.circles_next = (np.arange(num_circles)[:, None] * steps + ring_next).ravel()
+        self.circles_color = np.repeat(np.arange(num_circles), steps)
+
+        # スパイラル: 100頂点の開いた線（最後の頂点からは線を引かない）
+        steps = 100
+        index = np.arange(steps)
+        self.spiral_x = np.cos(index * math.pi / 8) * index * 2
+        self.spiral_y = np.sin(index * math.pi / 8) * index * 2
+        self.spiral_next = index[1:]
+        self.spiral_color = index[:-1] // 10
+
+        # 波紋: 5本 × 32頂点。半径方向の波は描画時に加える
+        num_rings = 5
+        steps = 32
+        self.ripple_cos = np.cos(ring_angles)
+        self.ripple_sin = np.sin(ring_angles)
+        self.ripple_wave_sin = np.sin(ring_angles * 8)
+        self.ripple_wave_cos = np.cos(ring_angles * 8)
+        self.ripple_radii = (np.arange(num_rings)[:, None] + 1) * 30
+        self.ripple_phase = np.arange(num_rings) * 0.5
+        self.ripple_next = (np.arange(num_rings)[:, None] * steps + ring_next).ravel()
+        self.ripple_color = np.repeat(np.arange(num_rings), steps)
+
     def init_sound(self):
         """サウンドの初期化"""
         # ビート音
@@ -55,68 +169,116 @@ class VJSimple:
         pyxel.sound(3).set("g3b3d4g4", "p", "7", "n", 20)
 
     def update(self):
+        self.input.poll()
+
         # STARTボタンまたはESCキーで終了
         if pyxel.btn(pyxel.GAMEPAD1_BUTTON_START) or pyxel.btn(pyxel.KEY_ESCAPE):
             pyxel.quit()
 
         # 左スティックX: 回転
-        self.rotation += self.get_analog_value("GAMEPAD1_AXIS_LEFTX", [pyxel.KEY_D, pyxel.KEY_A]) / 10000.0
+        self.rotation += self.input.value("GAMEPAD1_AXIS_LEFTX") / 10000.0
 
         # 左スティックY: スケール
         self.scale = max(
             0.1,
             min(
                 2.0,
-                self.scale + self.get_analog_value("GAMEPAD1_AXIS_LEFTY", [pyxel.KEY_S, pyxel.KEY_W]) / 50000.0,
+                self.scale + self.input.value("GAMEPAD1_AXIS_LEFTY") / 50000.0,
             ),
         )
 
         # 右スティックX: 色
-        self.color = (
-            self.color + int(self.get_analog_value("GAMEPAD1_AXIS_RIGHTX", [pyxel.KEY_RIGHT, pyxel.KEY_LEFT]) / 10000.0)
-        ) % 16
+        self.color = (self.color + int(self.input.value("GAMEPAD1_AXIS_RIGHTX") / 10000.0)) % 16
 
         # 右スティックY: パターン
-        self.pattern_type = (
-            self.pattern_type + int(self.get_analog_value("GAMEPAD1_AXIS_RIGHTY", [pyxel.KEY_DOWN, pyxel.KEY_UP]) / 10000.0)
-        ) % 4
+        self.pattern_type = (self.pattern_type + int(self.input.value("GAMEPAD1_AXIS_RIGHTY") / 10000.0)) % 4
+
+        # Cキー: フレームキャッシュの切り替え
+        if pyxel.btnp(pyxel.KEY_C):
+            self.frame_cache = None if self.frame_cache else FrameCache(self.SCREEN_WIDTH, self.SCREEN_HEIGHT)
+
+        # Rキー: 内部解像度の切り替え
+        if pyxel.btnp(pyxel.KEY_R):
+            if self.render_auto:
+                self.render_auto = False
+                self.render_scale = RENDER_SCALES[0]
+            elif self.render_scale == RENDER_SCALES[-1]:
+                self.render_auto = True
+            else:
+                self.render_scale = RENDER_SCALES[RENDER_SCALES.index(self.render_scale) + 1]
 
         # ボタン入力の処理
-        if self.is_button_pressed("GAMEPAD1_BUTTON_A", [pyxel.KEY_J]):
+        if self.input.is_pressed("GAMEPAD1_BUTTON_A"):
             self.beat = True
             pyxel.play(0, 0)
         else:
             self.beat = False
 
-        if self.is_button_pressed("GAMEPAD1_BUTTON_B", [pyxel.KEY_K]):
+        if self.input.is_pressed("GAMEPAD1_BUTTON_B"):
             pyxel.play(1, 1)
-        if self.is_button_pressed("GAMEPAD1_BUTTON_X", [pyxel.KEY_U]):
+        if self.input.is_pressed("GAMEPAD1_BUTTON_X"):
             pyxel.play(2, 2)
-        if self.is_button_pressed("GAMEPAD1_BUTTON_Y", [pyxel.KEY_I]):
+        if self.input.is_pressed("GAMEPAD1_BUTTON_Y"):
             pyxel.play(3, 3)
 
-    def get_analog_value(self, input_name, keyboard_keys):
-        """アナログ入力値の取得"""
-        value = pyxel.btnv(getattr(pyxel, input_name))
-
-        if len(keyboard_keys) == 2:
-            if pyxel.btn(keyboard_keys[0]):
-                value = 32767
-            elif pyxel.btn(keyboard_keys[1]):
-                value = -32768
-
-        return value
-
-    def is_button_pressed(self, input_name, keyboard_keys):
-        """ボタンの押下状態を取得"""
-        return pyxel.btn(getattr(pyxel, input_name)) or any(pyxel.btn(key) for key in keyboard_keys)
-
     def draw(self):
-        pyxel.cls(0)
-
-        # 画面中心座標
-        center_x = self.SCREEN_WIDTH // 2
-        center_y = self.SCREEN_HEIGHT // 2
+        if self.frame_cache is None:
+            self.draw_pattern(self.rotation, self.scale)
+            self.draw_render_info()
+            return
+
+        # パラメータを量子化してキーにし、同じキーのフレームは描画せずに転送する
+        rotation_index = round(self.rotation * ROTATION_STEPS / (math.pi * 2)) % ROTATION_STEPS
+        scale_index = round(self.scale / SCALE_STEP)
+        key = (self.pattern_type, rotation_index, scale_index, self.color, self.beat, self.render_scale)
+        image = self.frame_cache.get(key)
+        if image is not None:
+            pyxel.blt(0, 0, image, 0, 0, self.SCREEN_WIDTH, self.SCREEN_HEIGHT)
+        else:
+            self.draw_pattern(rotation_index * math.pi * 2 / ROTATION_STEPS, scale_index * SCALE_STEP)
+            self.frame_cache.store(key)
+
+        cache = self.frame_cache
+        pyxel.text(4, 4, f"CACHE {len(cache.frames)}/{cache.capacity} HIT {cache.hits} MISS {cache.misses}", 7)
+        self.draw_render_info()
+
+    def draw_render_info(self):
+        """内部解像度の設定を表示する（等倍の手動設定では何も表示しない）"""
+        if self.render_auto or self.render_scale > 1:
+            mode = "AUTO" if self.render_auto else "FIXED"
+            pyxel.text(4, 12, f"RENDER 1/{self.render_scale} {mode} {self.render_ms:.1f}ms", 7)
+
+    def update_render_scale(self, elapsed_ms):
+        """描画時間の移動平均が予算を超えたら解像度を下げ、十分に余裕があれば上げる"""
+        self.render_ms = self.render_ms * 0.9 + elapsed_ms * 0.1
+        if not self.render_auto:
+            return
+        if self.render_hold > 0:
+            self.render_hold -= 1
+            return
+
+        index = RENDER_SCALES.index(self.render_scale)
+        if self.render_ms > RENDER_BUDGET_MS and index < len(RENDER_SCALES) - 1:
+            self.render_scale = RENDER_SCALES[index + 1]
+            self.render_hold = RENDER_HOLD_FRAMES
+        elif self.render_ms < RENDER_BUDGET_MS * 0.4 and index > 0:
+            # 解像度を上げると描画時間は増えるので、予算より十分小さい場合だけ戻す
+            self.render_scale = RENDER_SCALES[index - 1]
+            self.render_hold = RENDER_HOLD_FRAMES
+
+    def draw_pattern(self, rotation, scale):
+        """現在のパターンを指定した回転角度とスケールで描画"""
+        start = time.perf_counter()
+        render_scale = self.render_scale
+        self.canvas = pyxel if render_scale == 1 else self.canvases[render_scale]
+        self.canvas.cls(0)
+
+        # 描画先の中心座標とスケール
+        width = self.SCREEN_WIDTH // render_scale
+        height = self.SCREEN_HEIGHT // render_scale
+        center_x = width // 2
+        center_y = height // 2
+        scale /= render_scale
 
         # ビート効果
         beat_scale = 1.2 if self.beat else 1.0
@@ -124,87 +286,64 @@ class VJSimple:
         # パターンの描画
         if self.pattern_type == 0:
             # 回転する星
-            self.draw_star(center_x, center_y, self.rotation, self.scale * beat_scale, self.color)
+            self.draw_star(center_x, center_y, rotation, scale * beat_scale, self.color)
         elif self.pattern_type == 1:
             # 同心円
-            self.draw_circles(center_x, center_y, self.rotation, self.scale * beat_scale, self.color)
+            self.draw_circles(center_x, center_y, rotation, scale * beat_scale, self.color)
         elif self.pattern_type == 2:
             # スパイラル
-            self.draw_spiral(center_x, center_y, self.rotation, self.scale * beat_scale, self.color)
+            self.draw_spiral(center_x, center_y, rotation, scale * beat_scale, self.color)
         else:
             # 波紋
-            self.draw_ripple(center_x, center_y, self.rotation, self.scale * beat_scale, self.color)
+            self.draw_ripple(center_x, center_y, rotation, scale * beat_scale, self.color)
+
+        # 縮小して描いた場合は画面全体に拡大して転送する（拡大は転送範囲の中心を基準に行われる）
+        if render_scale > 1:
+            pyxel.blt(
+                (self.SCREEN_WIDTH - width) / 2,
+                (self.SCREEN_HEIGHT - height) / 2,
+                self.canvas,
+                0,
+                0,
+                width,
+                height,
+                scale=render_scale,
+            )
+
+        self.update_render_scale((time.perf_counter() - start) * 1000)
 
     def draw_star(self, x, y, rotation, scale, color):
         """星型のパターンを描画"""
-        points = []
-        num_points = 5
-        for i in range(num_points * 2):
-            angle = rotation + i * math.pi / num_points
-            r = 100 * scale * (0.5 if i % 2 else 1.0)
-            px = x + math.cos(angle) * r
-            py = y + math.sin(angle) * r
-            points.append((px, py))
-
-        for i in range(num_points * 2):
-            p1 = points[i]
-            p2 = points[(i + 1) % (num_points * 2)]
-            pyxel.line(p1[0], p1[1], p2[0], p2[1], color)
+        xs, ys = trig.rotate_scale(self.star_x, self.star_y, rotation, scale, x, y)
+        self.draw_segments(xs, ys, self.star_next, (color + self.star_color) % 16)
 
     def draw_circles(self, x, y, rotation, scale, color):
         """同心円のパターンを描画"""
-        num_circles = 8
-        for i in range(num_circles):
-            r = (i + 1) * 20 * scale
-            steps = 32
-            points = []
-            for j in range(steps):
-                angle = rotation + j * math.pi * 2 / steps
-                px = x + math.cos(angle) * r
-                py = y + math.sin(angle) * r
-                points.append((px, py))
-
-            for j in range(steps):
-                p1 = points[j]
-                p2 = points[(j + 1) % steps]
-                pyxel.line(p1[0], p1[1], p2[0], p2[1], (color + i) % 16)
+        xs, ys = trig.rotate_scale(self.circles_x, self.circles_y, rotation, scale, x, y)
+        self.draw_segments(xs, ys, self.circles_next, (color + self.circles_color) % 16)
 
     def draw_spiral(self, x, y, rotation, scale, color):
         """スパイラルパターンを描画"""
-        points = []
-        steps = 100
-        for i in range(steps):
-            angle = rotation + i * math.pi / 8
-            r = i * 2 * scale
-            px = x + math.cos(angle) * r
-            py = y + math.sin(angle) * r
-            points.append((px, py))
-
-        for i in range(len(points) - 1):
-            p1 = points[i]
-            p2 = points[i + 1]
-            pyxel.line(p1[0], p1[1], p2[0], p2[1], (color + i // 10) % 16)
+        xs, ys = trig.rotate_scale(self.spiral_x, self.spiral_y, rotation, scale, x, y)
+        self.draw_segments(xs, ys, self.spiral_next, (color + self.spiral_color) % 16)
 
     def draw_ripple(self, x, y, rotation, scale, color):
         """波紋パターンを描画"""
-        num_rings = 5
-        for i in range(num_rings):
-            r = (i + 1) * 30 * scale
-            steps = 32
-            points = []
-            wave_height = math.sin(rotation + i * 0.5) * 10 * scale
-
-            for j in range(steps):
-                angle = j * math.pi * 2 / steps
-                wave = math.sin(angle * 8 + rotation) * wave_height
-                px = x + math.cos(angle) * (r + wave)
-                py = y + math.sin(angle) * (r + wave)
-                points.append((px, py))
-
-            for j in range(steps):
-                p1 = points[j]
-                p2 = points[(j + 1) % steps]
-                pyxel.line(p1[0], p1[1], p2[0], p2[1], (color + i) % 16)
+        # sin(8θ + rotation) を加法定理で基本形状の sin(8θ), cos(8θ) から求める
+        waves = self.ripple_wave_sin * trig.cos(rotation) + self.ripple_wave_cos * trig.sin(rotation)
+        wave_heights = trig.sin_array(rotation + self.ripple_phase) * 10 * scale
+        radii = self.ripple_radii * scale + wave_heights[:, None] * waves
+        xs = (x + self.ripple_cos * radii).ravel()
+        ys = (y + self.ripple_sin * radii).ravel()
+        self.draw_segments(xs, ys, self.ripple_next, (color + self.ripple_color) % 16)
+
+    def draw_segments(self, xs, ys, next_index, colors):
+        """先頭から len(next_index) 個の頂点について、next_index の頂点へ線を引く"""
+        count = len(next_index)
+        for segment in zip(
+            xs[:count].tolist(), ys[:count].tolist(), xs[next_index].tolist(), ys[next_index].tolist(), colors.tolist()
+        ):
+            self.canvas.line(*segment)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+"""pyxel の画像（画面を含む）の画素を NumPy 配列として一括で書き込むヘルパー
+
+Image.data_ptr が使える環境では画素のメモリをコピーせずに (height, width) の uint8 配列として共有し、
+色番号を直接書き込む。使えない環境では作業用の配列に書き込み、Image.set で画像にまとめて設定してから
+色0を透明色として転送する。
+
+折れ線や線分の配列は draw_polyline / draw_segments で描く。画素の展開は pyxel の line に任せ、
+draw_polyline は1画素未満の線分を次の線分にまとめて line の呼び出しを減らす。
+（NumPy で全画素を一度に展開する方法は、VJ の線分の本数と長さでは line を順に呼ぶより遅い）
+"""
+
+import numpy as np
+import pyxel
+
+HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)  # 色番号から Image.set 用の文字への変換表
+
+
+def image_array(image):
+    """image の画素を共有する (height, width) の uint8 配列を返す。生ポインタを取得できない場合は None"""
+    data_ptr = getattr(image, "data_ptr", None)
+    if data_ptr is None:
+        return None
+    try:
+        array = np.ctypeslib.as_array(data_ptr())
+    except (TypeError, ValueError):
+        return None
+    if array.dtype != np.uint8 or array.size != image.width * image.height:
+        return None
+    return array.reshape(image.height, image.width)
+
+
+def cell_index(cells, pixels):
+    """画素ごとに、その画素を含むセルの番号を返す（セル j は int(j * pixels / cells) の画素から始まる）"""
+    starts = (np.arange(cells) * (pixels / cells)).astype(np.intp)
+    return np.searchsorted(starts, np.arange(pixels), side="right") - 1
+
+
+class PixelTarget:
+    """画像に色番号を一括で書き込む
+
+    begin で書き込み先の配列を受け取り、書き終えたら commit を呼ぶ。直接書き込めない環境では
+    begin の配列は作業用で、0のままの画素（色0を書いた画素を含む）は元の画像の内容が残る。
+    """
+
+    def __init__(self, image=None):
+        self.image = pyxel.screen if image is None else image
+        self.width = self.image.width
+        self.height = self.image.height
+        self.array = image_array(self.image)
+        self.direct = self.array is not None
+        if not self.direct:
+            self.array = np.zeros((self.height, self.width), dtype=np.uint8)
+            self.staging = pyxel.Image(self.width, self.height)
+
+    def begin(self):
+        """書き込み先の配列を返す。作業用の配列の場合は透明色（0）で消しておく"""
+        if not self.direct:
+            self.array.fill(0)
+        return self.array
+
+    def commit(self):
+        """作業用の配列の内容を画像へ反映する（直接書き込んでいる場合は何もしない）"""
+        if self.direct:
+            return
+        rows = HEX_DIGITS[self.array].view(f"S{self.width}").ravel()
+        self.staging.set(0, 0, [row.decode() for row in rows])
+        self.image.blt(0, 0, self.staging, 0, 0, self.width, self.height, 0)
+
+
+def pixel_coordinates(values):
+    """座標を pyxel と同じく float32 にしてから0から遠い側へ四捨五入し、描かれる画素の座標を返す"""
+    values = np.asarray(values, dtype=np.float32).astype(float)
+    return np.copysign(np.floor(np.abs(values) + 0.5), values)
+
+
+def draw_segments(target, x1, y1, x2, y2, colors):
+    """線分の配列を target（PixelTarget）の画像に描く。colors は線分ごとの色（または1色）
+
+    座標はまとめて Python のリストに変換し、画像の line を順に呼ぶ。
+    """
+    x1 = np.asarray(x1)
+    segments = np.stack([x1, y1, x2, y2], axis=1).tolist()
+    colors = np.broadcast_to(colors, x1.shape).tolist()
+    line = target.image.line
+    for (sx, sy, ex, ey), color in zip(segments, colors):
+        line(sx, sy, ex, ey, color)
+
+
+def draw_polyline(target, xs, ys, colors, closed=False):
+    """頂点の配列を順につないだ折れ線を target（PixelTarget）に描く。colors は線分ごとの色（または1色）
+
+    四捨五入すると直前の頂点と同じ画素になる頂点は取り除き、1画素未満の線分はその次の線分にまとめる
+    （描かれる画素は線分を1本ずつ pyxel.line で描いた場合と同じ）。
+    closed が True の場合は最後の頂点から最初の頂点へも線を引く。
+    """
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    if len(xs) < 2:
+        return
+    if closed:
+        xs = np.append(xs, xs[0])
+        ys = np.append(ys, ys[0])
+    colors = np.broadcast_to(colors, (len(xs) - 1,))
+
+    # 直前の頂点と同じ画素の頂点を除く。残った頂点へ入る線分の色を使う
+    # 最後の頂点は残す（最後の1画素未満の線分の色がその画素に残るため）
+    px = pixel_coordinates(xs)
+    py = pixel_coordinates(ys)
+    moved = (px[1:] != px[:-1]) | (py[1:] != py[:-1])
+    moved[-1] = True
+    keep = np.flatnonzero(np.r_[True, moved])
+    start = keep[:-1]
+    end = keep[1:]
+    draw_segments(target, xs[start], ys[start], xs[end], ys[end], colors[end - 1])
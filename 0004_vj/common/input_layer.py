@@ -0,0 +1,80 @@
+"""ゲームパッドとキーボードの入力を1フレームに1回だけまとめて読み取る共通入力レイヤー
+
+各アプリの analog_inputs / digital_inputs と同じ形式の対応表を受け取り、
+pyxel の定数名を起動時に整数コードへ変換しておく。update の先頭で poll を呼ぶと
+対応表に現れる全てのボタンとアナログ軸を1回ずつ読み取り、結果を配列に保持する。
+"""
+
+from array import array
+
+import pyxel
+
+AXIS_MAX = 32767
+AXIS_MIN = -32768
+
+
+class InputLayer:
+    """対応表を整数コードへ変換し、入力のスナップショットを配列で保持する"""
+
+    def __init__(self, analog_inputs=(), digital_inputs=()):
+        self.button_codes = []  # 読み取るボタンとキーのコード（重複なし）
+        slots = {}
+
+        def slot(code):
+            if code not in slots:
+                slots[code] = len(self.button_codes)
+                self.button_codes.append(code)
+            return slots[code]
+
+        # アナログ入力: (軸のコード, 正方向キーの位置, 負方向キーの位置)。キーが無い場合は -1
+        self.analog_table = []
+        for name, keyboard_keys in analog_inputs:
+            positive = slot(keyboard_keys[0]) if len(keyboard_keys) >= 1 else -1
+            negative = slot(keyboard_keys[1]) if len(keyboard_keys) >= 2 else -1
+            self.analog_table.append((getattr(pyxel, name), positive, negative))
+
+        # デジタル入力: ボタン自身とキーボードのキーの位置
+        self.digital_table = []
+        for name, keyboard_keys in digital_inputs:
+            self.digital_table.append(tuple([slot(getattr(pyxel, name))] + [slot(key) for key in keyboard_keys]))
+
+        # 名前からスナップショット配列の位置を引く表（アナログ入力の後にデジタル入力が並ぶ）
+        names = [name for name, _ in analog_inputs] + [name for name, _ in digital_inputs]
+        self.index = {name: i for i, name in enumerate(names)}
+        self.button_state = bytearray(len(self.button_codes))
+        self.values = array("i", [0] * len(names))
+
+    def poll(self):
+        """全てのボタンとアナログ軸を1回ずつ読み取り、スナップショットを更新する"""
+        btn = pyxel.btn
+        state = self.button_state
+        for i, code in enumerate(self.button_codes):
+            state[i] = btn(code)
+
+        values = self.values
+        btnv = pyxel.btnv
+        for i, (axis, positive, negative) in enumerate(self.analog_table):
+            # キーボード入力の場合は最大値を返す
+            if positive >= 0 and state[positive]:
+                values[i] = AXIS_MAX
+            elif negative >= 0 and state[negative]:
+                values[i] = AXIS_MIN
+            else:
+                values[i] = btnv(axis)
+
+        offset = len(self.analog_table)
+        for i, button_slots in enumerate(self.digital_table):
+            pressed = 0
+            for s in button_slots:
+                if state[s]:
+                    pressed = 1
+                    break
+            values[offset + i] = pressed
+
+    def value(self, name):
+        """アナログ入力値の取得"""
+        return self.values[self.index[name]]
+
+    def is_pressed(self, name):
+        """ボタンの押下状態を取得"""
+        return self.values[self.index[name]] != 0
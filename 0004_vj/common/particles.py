@@ -0,0 +1,77 @@
+"""NumPy 配列で管理するパーティクルのリングバッファ
+
+位置・速度・寿命・色を起動時に確保した配列に持ち、生成・移動・寿命の減少・画面外の消去を
+配列演算でまとめて行う。容量を超えて生成した場合は最も古いパーティクルから上書きする。
+"""
+
+import numpy as np
+
+from .fast_trig import TAU
+from .fast_trig import table as trig
+
+DEFAULT_CAPACITY = 1 << 17  # 131072。10万個を保持できる大きさ
+
+
+class ParticleRing:
+    """固定容量のパーティクル配列。life が0のスロットは空きとして扱う"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, seed=None):
+        self.capacity = capacity
+        self.x = np.zeros(capacity, dtype=np.float32)
+        self.y = np.zeros(capacity, dtype=np.float32)
+        self.vx = np.zeros(capacity, dtype=np.float32)
+        self.vy = np.zeros(capacity, dtype=np.float32)
+        self.life = np.zeros(capacity, dtype=np.int32)
+        self.color = np.zeros(capacity, dtype=np.uint8)
+        self.head = 0  # 次に書き込む位置
+        self.max_life = 0  # 残っているパーティクルの寿命の上限（0なら全てのスロットが空き）
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.life))
+
+    def emit(self, count, x, y, speed_min, speed_max, life, color):
+        """(x, y) からランダムな方向へ count 個のパーティクルを放出する"""
+        count = min(int(count), self.capacity)
+        if count <= 0:
+            return
+
+        index = (self.head + np.arange(count)) % self.capacity
+        angles = self.rng.uniform(0.0, TAU, count)
+        speeds = self.rng.uniform(speed_min, speed_max, count)
+        self.x[index] = x
+        self.y[index] = y
+        self.vx[index] = trig.cos_array(angles) * speeds
+        self.vy[index] = trig.sin_array(angles) * speeds
+        self.life[index] = life
+        self.color[index] = color
+        self.head = (self.head + count) % self.capacity
+        self.max_life = max(self.max_life, int(life))
+
+    def update(self, width, height):
+        """全てのパーティクルを移動して寿命を減らし、画面外に出たものを消す
+
+        全てのパーティクルの寿命が尽きた後は、次に放出するまで配列を走査しない。
+        """
+        if self.max_life == 0:
+            return
+        self.max_life -= 1
+
+        self.x += self.vx
+        self.y += self.vy
+        np.subtract(self.life, 1, out=self.life, where=self.life > 0)
+
+        # 描画時に四捨五入した座標が画面外になるものは二度と表示されないので消す
+        offscreen = (self.x < -0.5) | (self.x >= width - 0.5) | (self.y < -0.5) | (self.y >= height - 0.5)
+        self.life[offscreen] = 0
+
+    def draw(self, target):
+        """生きているパーティクルを target（framebuffer.PixelTarget）へ点として一括で書き込む"""
+        alive = np.flatnonzero(self.life)
+        if len(alive) == 0:
+            return
+
+        # update で画面外のパーティクルは消しているので、四捨五入した座標は必ず画面内に収まる
+        pixels = target.begin()
+        pixels[np.rint(self.y[alive]).astype(np.intp), np.rint(self.x[alive]).astype(np.intp)] = self.color[alive]
+        target.commit()
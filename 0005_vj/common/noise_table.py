@@ -0,0 +1,120 @@
+"""pyxel.noise を細かい間隔で引いておく、周期的（タイル状）なノイズのテーブル
+
+pyxel.noise（Perlin ノイズ）は各軸とも 256 ごとに同じ値を繰り返す。このモジュールでは y = z = 0 の
+直線上の1周期を1単位あたり resolution 個に分割したテーブルを持ち、座標の配列をまとめて線形補間で引く。
+座標をずらして引くだけでスクロールでき、周期の端でも継ぎ目は出ない。
+テーブルは chunk 個ずつに分けてあり、初めて参照された部分だけを pyxel.noise で埋める。
+起動時にまとめて作る場合は fill_all を呼ぶ。
+
+fractal は周波数を2倍ずつ上げたオクターブを重ねたノイズ（fBm）を、同じテーブルから配列演算で一度に求める。
+リポジトリのルートで `python -m common.noise_table` を実行すると、pyxel.noise との誤差の確認と、
+pyxel.noise を直接呼ぶ場合とのベンチマークができる。
+"""
+
+import numpy as np
+import pyxel
+
+NOISE_PERIOD = 256  # pyxel.noise が同じ値を繰り返す周期
+DEFAULT_RESOLUTION = 32
+DEFAULT_CHUNK = 256
+
+
+class NoiseTable:
+    """pyxel.noise(x, 0) を1周期分保持するテーブル。pyxel.nseed を変えた場合は作り直す"""
+
+    def __init__(self, resolution=DEFAULT_RESOLUTION, chunk=DEFAULT_CHUNK):
+        self.resolution = resolution
+        self.chunk = chunk
+        self.size = NOISE_PERIOD * resolution
+        self.values = np.zeros(self.size, dtype=np.float32)
+        self.filled = np.zeros(-(-self.size // chunk), dtype=bool)  # チャンクごとに埋めたかどうか
+
+    def fill(self, chunks):
+        """指定したチャンクのうち、まだ埋めていないものを pyxel.noise で埋める"""
+        for chunk in chunks[~self.filled[chunks]].tolist():
+            start = chunk * self.chunk
+            end = min(start + self.chunk, self.size)
+            self.values[start:end] = [pyxel.noise(i / self.resolution, 0) for i in range(start, end)]
+            self.filled[chunk] = True
+
+    def fill_all(self):
+        """テーブル全体を埋める（起動時に作っておく場合に使う）"""
+        self.fill(np.arange(len(self.filled)))
+
+    def sample(self, xs):
+        """座標 xs（pyxel.noise の x と同じ単位）のノイズを線形補間で返す"""
+        position = np.asarray(xs, dtype=float) * self.resolution
+        base = np.floor(position)
+        fraction = position - base
+        index = base.astype(np.intp) % self.size
+        next_index = (index + 1) % self.size
+        if not self.filled.all():
+            self.fill(np.unique(np.concatenate([index.ravel(), next_index.ravel()]) // self.chunk))
+
+        values = self.values[index]
+        return values + (self.values[next_index] - values) * fraction
+
+    def fractal(self, xs, octaves=4, gain=0.5):
+        """周波数を2倍、振幅を gain 倍ずつにしたオクターブを重ねたノイズを返す
+
+        振幅の合計で割って、1オクターブの場合と同じ範囲に収める。全オクターブを1回の sample でまとめて引く。
+        """
+        xs = np.asarray(xs, dtype=float)
+        frequencies = 2.0 ** np.arange(octaves)
+        weights = gain ** np.arange(octaves)
+        layers = self.sample(frequencies.reshape((octaves,) + (1,) * xs.ndim) * xs)
+        return np.tensordot(weights / weights.sum(), layers, axes=1)
+
+
+def check_accuracy(table=None, samples=20000):
+    """ランダムな座標で pyxel.noise と比較し、最大誤差を返す（周期の端で値がずれたら AssertionError）"""
+    table = NoiseTable() if table is None else table
+    rng = np.random.default_rng(0)
+    xs = rng.uniform(-1000.0, 1000.0, samples)
+    expected = np.array([pyxel.noise(x, 0) for x in xs.tolist()])
+    error = float(np.abs(table.sample(xs) - expected).max())
+
+    # 1周期ずらしても同じ値になること（タイル状に並べても継ぎ目が出ない）
+    assert np.abs(table.sample(xs + NOISE_PERIOD) - table.sample(xs)).max() < 1e-4
+    assert np.abs(table.sample(np.array([NOISE_PERIOD - 1e-9, 0.0]))).max() < 1e-4
+    return error
+
+
+def benchmark(table=None, points=256, octaves=4, repeat=500):
+    """ノイズ波形1本分（points 点）のノイズを求める時間を pyxel.noise と比較し、1回あたりの時間（マイクロ秒）を返す"""
+    import timeit
+
+    table = NoiseTable() if table is None else table
+    table.fill_all()
+    xs = np.arange(points) * 0.05 + 12.3
+
+    def with_pyxel():
+        return np.array([pyxel.noise(x, 0) for x in xs.tolist()])
+
+    def with_pyxel_octaves():
+        return np.array(
+            [sum(pyxel.noise(x * 2**octave, 0) * 0.5**octave for octave in range(octaves)) for x in xs.tolist()]
+        )
+
+    def with_table():
+        return table.sample(xs)
+
+    def with_table_octaves():
+        return table.fractal(xs, octaves)
+
+    results = {}
+    for name, func in (
+        ("pyxel", with_pyxel),
+        (f"pyxel x{octaves}", with_pyxel_octaves),
+        ("table", with_table),
+        (f"table x{octaves}", with_table_octaves),
+    ):
+        results[name] = min(timeit.repeat(func, number=repeat, repeat=3)) / repeat * 1e6
+    return results
+
+
+if __name__ == "__main__":
+    for resolution in (8, DEFAULT_RESOLUTION, 128):
+        print(f"resolution {resolution:4d}: max error {check_accuracy(NoiseTable(resolution)):.6f}")
+    for name, us in benchmark().items():
+        print(f"{name:>9}: {us:8.2f} us / 256 points")
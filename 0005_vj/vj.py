@@ -10,12 +10,42 @@ import math
 import random
 from collections import deque
 
+import numpy as np
+
+from common.fast_trig import table as trig
+from common.framebuffer import PixelTarget, draw_polyline, draw_segments
+from common.input_layer import InputLayer
+from common.noise_table import NoiseTable
+from common.particles import ParticleRing
+
+# パーティクルの設定
+PARTICLE_EMIT_RATE = 0.1  # intensity 1.0 のときに毎フレーム生成する平均個数
+PARTICLE_BURST = 25000  # バースト放出（キーB）が有効なとき、intensity 1.0 でビートごとに放出する個数（2.0 で10万個）
+PARTICLE_LIFE = 60  # 寿命（フレーム数）
+PARTICLE_PATTERN = 1  # パーティクルパターンの pattern_type
+
+# フラクタルの設定
+FRACTAL_PRIMITIVE_BUDGET = 5000  # 1フレームに描く図形数の上限
+FRACTAL_EXTENT = 2.0  # 子孫を含めた広がりはサイズの2倍以内に収まる
+FRACTAL_IMAGE_SIZE = 512  # 画像の転送で描く場合に、1階層分を組み立てるオフスクリーン画像の大きさ
+# サブパターンごとの (子の数, 子までの距離のサイズ比, 子のサイズ比, 1ノードあたりの図形数)
+FRACTAL_SHAPES = (
+    (6, 1.0, 0.5, 1),  # 円
+    (3, 1.0, 0.5, 3),  # 三角
+    (4, 0.5, 0.5, 1),  # 四角
+    (5, 1.0, 0.4, 5),  # 星
+)
+
+# ノイズ波形の設定
+NOISE_OCTAVES = 4  # フラクタル表示で重ねるオクターブ数
+
 
 class EnhancedVJ:
     def __init__(self):
         self.SCREEN_WIDTH = 256
         self.SCREEN_HEIGHT = 256
         pyxel.init(self.SCREEN_WIDTH, self.SCREEN_HEIGHT)
+        self.pixels = PixelTarget()  # 画面の画素をまとめて書き込むための配列
 
         # パターンの状態
         self.pattern_type = 0  # パターンの種類
@@ -24,9 +54,14 @@ class EnhancedVJ:
         self.scale = 1.0  # スケール
         self.color_phase = 0  # 色相
         self.wave_phase = 0  # 波動位相
-        self.particles = []  # パーティクル
+        self.particles = ParticleRing()  # パーティクル
         self.trails = deque(maxlen=32)  # 軌跡
         self.beat = False  # ビート状態
+        self.particle_burst = False  # ビートでパーティクルをまとめて放出するか（キーBで切替）
+        self.fractal_blit = False  # フラクタルを画像の転送で描くか（キーFで切替）
+        self.fractal_images = None  # 画像の転送で使うオフスクリーン画像（初回に確保）
+        self.noise_table = NoiseTable()  # ノイズ波形用のノイズのテーブル（参照した部分から順に作る）
+        self.noise_fractal = False  # ノイズ波形にオクターブを重ねるか（キーNで切替）
         self.auto_beat = 0  # 自動ビート
 
         # パラメータ
@@ -60,6 +95,9 @@ class EnhancedVJ:
             ("GAMEPAD1_BUTTON_RIGHTSHOULDER", [pyxel.KEY_2]),  # 自動ビート+
         ]
 
+        # 入力レイヤー（全ての入力を1フレームに1回だけ読み取る）
+        self.input = InputLayer(self.analog_inputs, self.digital_inputs)
+
         pyxel.run(self.update, self.draw)
 
     def init_sound(self):
@@ -80,6 +118,8 @@ class EnhancedVJ:
         pyxel.musics[3].set([0, 3], [], [], [])
 
     def update(self):
+        self.input.poll()
+
         # STARTボタンまたはESCキーで終了
         if pyxel.btn(pyxel.GAMEPAD1_BUTTON_START) or pyxel.btn(pyxel.KEY_ESCAPE):
             pyxel.quit()
@@ -89,6 +129,18 @@ class EnhancedVJ:
             self.glitch = not self.glitch
             pyxel.play(1, 1)
 
+        # パーティクルのバースト放出の切り替え（キーBを押す）
+        if pyxel.btnp(pyxel.KEY_B):
+            self.particle_burst = not self.particle_burst
+
+        # フラクタルの描画方式の切り替え（キーFを押す）
+        if pyxel.btnp(pyxel.KEY_F):
+            self.fractal_blit = not self.fractal_blit
+
+        # ノイズ波形のオクターブの切り替え（キーNを押す）
+        if pyxel.btnp(pyxel.KEY_N):
+            self.noise_fractal = not self.noise_fractal
+
         # 自動ビート更新
         self.auto_beat = (self.auto_beat + 1) % 30
         if self.auto_beat == 0:
@@ -113,40 +165,40 @@ class EnhancedVJ:
         self.color_phase = (self.color_phase + self.speed * 0.02) % 16
 
         # 回転更新
-        self.rotation += self.get_analog_value("GAMEPAD1_AXIS_LEFTX", [pyxel.KEY_D, pyxel.KEY_A]) / 10000.0
+        self.rotation += self.input.value("GAMEPAD1_AXIS_LEFTX") / 10000.0
 
         # スケール更新
         self.scale = max(
             0.1,
             min(
                 2.0,
-                self.scale + self.get_analog_value("GAMEPAD1_AXIS_LEFTY", [pyxel.KEY_S, pyxel.KEY_W]) / 50000.0,
+                self.scale + self.input.value("GAMEPAD1_AXIS_LEFTY") / 50000.0,
             ),
         )
 
         # パターン変更
-        if self.is_button_pressed("GAMEPAD1_BUTTON_B", [pyxel.KEY_K]):
+        if self.input.is_pressed("GAMEPAD1_BUTTON_B"):
             self.pattern_type = (self.pattern_type + 1) % 5  # 4種類から5種類へ（新パターン追加）
             pyxel.play(2, 2)
             pyxel.playm(self.pattern_type)
 
         # サブパターン変更
-        if self.is_button_pressed("GAMEPAD1_BUTTON_X", [pyxel.KEY_U]):
+        if self.input.is_pressed("GAMEPAD1_BUTTON_X"):
             self.sub_pattern = (self.sub_pattern - 1) % 4
             pyxel.play(3, 3)
-        if self.is_button_pressed("GAMEPAD1_BUTTON_Y", [pyxel.KEY_I]):
+        if self.input.is_pressed("GAMEPAD1_BUTTON_Y"):
             self.sub_pattern = (self.sub_pattern + 1) % 4
             pyxel.play(3, 3)
 
         # ビート効果
-        if self.is_button_pressed("GAMEPAD1_BUTTON_A", [pyxel.KEY_J]):
+        if self.input.is_pressed("GAMEPAD1_BUTTON_A"):
             self.beat = True
             pyxel.play(1, 1)
 
         # 自動ビート速度変更
-        if self.is_button_pressed("GAMEPAD1_BUTTON_LEFTSHOULDER", [pyxel.KEY_1]):
+        if self.input.is_pressed("GAMEPAD1_BUTTON_LEFTSHOULDER"):
             self.speed = max(0.5, self.speed - 0.1)
-        if self.is_button_pressed("GAMEPAD1_BUTTON_RIGHTSHOULDER", [pyxel.KEY_2]):
+        if self.input.is_pressed("GAMEPAD1_BUTTON_RIGHTSHOULDER"):
             self.speed = min(2.0, self.speed + 0.1)
 
     def update_parameters(self):
@@ -156,7 +208,7 @@ class EnhancedVJ:
             0.5,
             min(
                 2.0,
-                self.speed + self.get_analog_value("GAMEPAD1_AXIS_RIGHTX", [pyxel.KEY_RIGHT, pyxel.KEY_LEFT]) / 50000.0,
+                self.speed + self.input.value("GAMEPAD1_AXIS_RIGHTX") / 50000.0,
             ),
         )
         # 強度
@@ -164,12 +216,12 @@ class EnhancedVJ:
             0.1,
             min(
                 2.0,
-                self.intensity + self.get_analog_value("GAMEPAD1_AXIS_RIGHTY", [pyxel.KEY_DOWN, pyxel.KEY_UP]) / 50000.0,
+                self.intensity + self.input.value("GAMEPAD1_AXIS_RIGHTY") / 50000.0,
             ),
         )
         # 複雑さ
-        trigger_left = self.get_analog_value("GAMEPAD1_AXIS_TRIGGERLEFT", [pyxel.KEY_Q])
-        trigger_right = self.get_analog_value("GAMEPAD1_AXIS_TRIGGERRIGHT", [pyxel.KEY_E])
+        trigger_left = self.input.value("GAMEPAD1_AXIS_TRIGGERLEFT")
+        trigger_right = self.input.value("GAMEPAD1_AXIS_TRIGGERRIGHT")
         self.complexity = max(
             0.1,
             min(
@@ -179,30 +231,24 @@ class EnhancedVJ:
         )
 
     def update_particles(self):
-        """パーティクルの更新"""
-        # 新しいパーティクルの生成
-        if random.random() < self.intensity * 0.1:
-            angle = random.uniform(0, math.pi * 2)
-            speed = random.uniform(1, 3) * self.speed
-            self.particles.append(
-                {
-                    "x": self.SCREEN_WIDTH // 2,
-                    "y": self.SCREEN_HEIGHT // 2,
-                    "vx": math.cos(angle) * speed,
-                    "vy": math.sin(angle) * speed,
-                    "life": 60,
-                    "color": int(self.color_phase),
-                }
+        """パーティクルの更新（生成はパーティクルパターンを表示している間だけ。移動と寿命管理は毎フレーム行う）"""
+        if self.pattern_type == PARTICLE_PATTERN:
+            # 新しいパーティクルの生成（平均で毎フレーム intensity * 0.1 個。バースト放出が有効ならビートでも放出する）
+            count = self.particles.rng.poisson(self.intensity * PARTICLE_EMIT_RATE)
+            if self.beat and self.particle_burst:
+                count += int(self.intensity * PARTICLE_BURST)
+            self.particles.emit(
+                count,
+                self.SCREEN_WIDTH // 2,
+                self.SCREEN_HEIGHT // 2,
+                self.speed,
+                3 * self.speed,
+                PARTICLE_LIFE,
+                int(self.color_phase),
             )
-        # パーティクルの移動と寿命管理
-        new_particles = []
-        for p in self.particles:
-            p["x"] += p["vx"]
-            p["y"] += p["vy"]
-            p["life"] -= 1
-            if p["life"] > 0:
-                new_particles.append(p)
-        self.particles = new_particles
+
+        # パーティクルの移動と寿命管理（寿命が尽きた後は何もしない）
+        self.particles.update(self.SCREEN_WIDTH, self.SCREEN_HEIGHT)
 
     def update_trails(self):
         """軌跡の更新"""
@@ -211,23 +257,6 @@ class EnhancedVJ:
         y = self.SCREEN_HEIGHT // 2 + math.sin(t * 0.1) * 50
         self.trails.append((x, y))
 
-    def get_analog_value(self, input_name, keyboard_keys):
-        """アナログ入力値の取得"""
-        value = pyxel.btnv(getattr(pyxel, input_name))
-        if len(keyboard_keys) == 2:
-            if pyxel.btn(keyboard_keys[0]):
-                value = 32767
-            elif pyxel.btn(keyboard_keys[1]):
-                value = -32768
-        elif len(keyboard_keys) == 1:
-            if pyxel.btn(keyboard_keys[0]):
-                value = 32767
-        return value
-
-    def is_button_pressed(self, input_name, keyboard_keys):
-        """ボタンの押下状態を取得"""
-        return pyxel.btn(getattr(pyxel, input_name)) or any(pyxel.btn(key) for key in keyboard_keys)
-
     def draw(self):
         pyxel.cls(0)
         # 画面中心座標
@@ -259,70 +288,158 @@ class EnhancedVJ:
             self.draw_glitch()
 
     def draw_fractal(self, x, y, beat_scale):
-        """フラクタルパターンの描画"""
+        """フラクタルパターンの描画
+
+        浅い階層から1階層ずつ幅優先で描く。同じ階層のノードは全て同じサイズなので、
+        座標は numpy 配列でまとめて計算する。子孫ごと画面外にある部分木は捨て、
+        次の階層が図形数の上限に収まらない場合はそこで打ち切る（浅いフラクタルとして描かれる）。
+        """
+        if self.fractal_blit:
+            self.draw_fractal_blit(x, y, beat_scale)
+            return
+
+        count, distance, ratio, cost = FRACTAL_SHAPES[self.sub_pattern]
+        dx, dy = trig.polar(0.0, 0.0, self.rotation + np.arange(count) * math.pi * 2 / count, 1.0)
+
+        xs = np.array([x], dtype=float)
+        ys = np.array([y], dtype=float)
+        size = 80 * self.scale * beat_scale
+        budget = FRACTAL_PRIMITIVE_BUDGET
+
+        for depth in range(int(self.complexity * 4), 0, -1):
+            if size < 2:
+                break
+
+            # 子孫を含めた広がりが画面に掛からないノードを捨てる
+            extent = size * FRACTAL_EXTENT
+            visible = (
+                (xs + extent >= 0)
+                & (xs - extent < self.SCREEN_WIDTH)
+                & (ys + extent >= 0)
+                & (ys - extent < self.SCREEN_HEIGHT)
+            )
+            xs = xs[visible]
+            ys = ys[visible]
+
+            # 同じ画素に重なったノードは1つにまとめる
+            if len(xs) > 1:
+                _, first = np.unique(np.rint(np.stack([xs, ys])), axis=1, return_index=True)
+                first.sort()
+                xs = xs[first]
+                ys = ys[first]
+
+            if len(xs) == 0 or len(xs) * cost > budget:
+                break
+            budget -= len(xs) * cost
 
-        def draw_recursive(x, y, size, depth):
-            if depth <= 0 or size < 2:
-                return
             color = (int(self.color_phase) + depth) % 16
+            child_xs = xs[:, None] + dx * (size * distance)
+            child_ys = ys[:, None] + dy * (size * distance)
+
             if self.sub_pattern == 0:
                 # 円フラクタル
-                pyxel.circb(x, y, size, color)
-                for i in range(6):
-                    angle = self.rotation + i * math.pi / 3
-                    nx = x + math.cos(angle) * size
-                    ny = y + math.sin(angle) * size
-                    draw_recursive(nx, ny, size * 0.5, depth - 1)
-            elif self.sub_pattern == 1:
-                # 三角フラクタル
-                size_half = size * 0.5
-                points = []
-                for i in range(3):
-                    angle = self.rotation + i * math.pi * 2 / 3
-                    px = x + math.cos(angle) * size
-                    py = y + math.sin(angle) * size
-                    points.append((px, py))
-                for i in range(3):
-                    p1 = points[i]
-                    p2 = points[(i + 1) % 3]
-                    pyxel.line(p1[0], p1[1], p2[0], p2[1], color)
-                for px, py in points:
-                    draw_recursive(px, py, size_half, depth - 1)
+                for px, py in zip(xs.tolist(), ys.tolist()):
+                    pyxel.circb(px, py, size, color)
             elif self.sub_pattern == 2:
                 # 四角フラクタル
                 size_half = size * 0.5
-                pyxel.rectb(x - size_half, y - size_half, size, size, color)
-                for i in range(4):
-                    angle = self.rotation + i * math.pi / 2
-                    nx = x + math.cos(angle) * size_half
-                    ny = y + math.sin(angle) * size_half
-                    draw_recursive(nx, ny, size * 0.5, depth - 1)
+                for px, py in zip(xs.tolist(), ys.tolist()):
+                    pyxel.rectb(px - size_half, py - size_half, size, size, color)
             else:
-                # 星フラクタル
-                points = []
-                for i in range(5):
-                    angle = self.rotation + i * math.pi * 2 / 5
-                    px = x + math.cos(angle) * size
-                    py = y + math.sin(angle) * size
-                    points.append((px, py))
-                for i in range(5):
-                    p1 = points[i]
-                    p2 = points[(i + 2) % 5]
-                    pyxel.line(p1[0], p1[1], p2[0], p2[1], color)
-                for px, py in points:
-                    draw_recursive(px, py, size * 0.4, depth - 1)
-
-        depth = int(self.complexity * 4)
+                # 三角フラクタルは隣の頂点へ、星フラクタルは2つ先の頂点へ線を引く
+                step = 1 if self.sub_pattern == 1 else 2
+                for segment in zip(
+                    child_xs.ravel().tolist(),
+                    child_ys.ravel().tolist(),
+                    np.roll(child_xs, -step, axis=1).ravel().tolist(),
+                    np.roll(child_ys, -step, axis=1).ravel().tolist(),
+                ):
+                    pyxel.line(*segment, color)
+
+            xs = child_xs.ravel()
+            ys = child_ys.ravel()
+            size *= ratio
+
+    def draw_fractal_blit(self, x, y, beat_scale):
+        """画像の転送によるフラクタルの描画
+
+        最も深い階層の図形をオフスクリーン画像に描き、1つ上の階層はその画像を子の位置へ
+        転送してから自分の図形を重ねて作る。子の向きは全てのノードで共通なので回転は不要で、
+        処理量は階層の数に比例する（子の数の階層乗にはならない）。最上位の階層だけは画面に直接描く。
+        """
+        count, distance, ratio, _ = FRACTAL_SHAPES[self.sub_pattern]
+        dx, dy = trig.polar(0.0, 0.0, self.rotation + np.arange(count) * math.pi * 2 / count, 1.0)
+        offsets = list(zip(dx.tolist(), dy.tolist()))
+
+        # 上の階層から順に (深さ, サイズ) を求める。サイズ2未満の階層は描かない
+        levels = []
         size = 80 * self.scale * beat_scale
-        draw_recursive(x, y, size, depth)
+        for depth in range(int(self.complexity * 4), 0, -1):
+            if size < 2:
+                break
+            levels.append((depth, size))
+            size *= ratio
+        if not levels:
+            return
+
+        if self.fractal_images is None:
+            self.fractal_images = [pyxel.Image(FRACTAL_IMAGE_SIZE, FRACTAL_IMAGE_SIZE) for _ in range(2)]
+        center = FRACTAL_IMAGE_SIZE // 2
+
+        # 深い階層から順に、2枚の画像を交互に使って組み立てる
+        source = None  # 1つ下の階層を描いた画像
+        source_extent = 0  # 1つ下の階層の広がり（画像の中心からの画素数）
+        for level, (depth, size) in enumerate(reversed(levels)):
+            extent = min(math.ceil(size * FRACTAL_EXTENT) + 1, center - 1)
+            if level == len(levels) - 1:
+                canvas, cx, cy = pyxel, x, y
+            else:
+                canvas, cx, cy = self.fractal_images[level % 2], center, center
+                canvas.rect(center - extent, center - extent, extent * 2 + 1, extent * 2 + 1, 0)
+
+            color = (int(self.color_phase) + depth) % 16
+            self.draw_fractal_shape(canvas, cx, cy, size, color, offsets, distance)
+
+            if source is not None:
+                width = source_extent * 2 + 1
+                for ox, oy in offsets:
+                    canvas.blt(
+                        round(cx + ox * size * distance) - source_extent,
+                        round(cy + oy * size * distance) - source_extent,
+                        source,
+                        center - source_extent,
+                        center - source_extent,
+                        width,
+                        width,
+                        0,
+                    )
+
+            source = canvas
+            source_extent = extent
+
+    def draw_fractal_shape(self, canvas, x, y, size, color, offsets, distance):
+        """フラクタルの1ノード分の図形を canvas（画面またはオフスクリーン画像）に描く"""
+        if self.sub_pattern == 0:
+            # 円フラクタル
+            canvas.circb(x, y, size, color)
+        elif self.sub_pattern == 2:
+            # 四角フラクタル
+            size_half = size * 0.5
+            canvas.rectb(x - size_half, y - size_half, size, size, color)
+        else:
+            # 三角フラクタルは隣の頂点へ、星フラクタルは2つ先の頂点へ線を引く
+            step = 1 if self.sub_pattern == 1 else 2
+            points = [(x + ox * size * distance, y + oy * size * distance) for ox, oy in offsets]
+            for i, (x1, y1) in enumerate(points):
+                x2, y2 = points[(i + step) % len(points)]
+                canvas.line(x1, y1, x2, y2, color)
 
     def draw_particles(self, x, y, beat_scale):
         """パーティクルパターンの描画"""
         t = pyxel.frame_count * self.speed
         if self.sub_pattern == 0:
             # 通常パーティクル
-            for p in self.particles:
-                pyxel.pset(p["x"], p["y"], p["color"])
+            self.particles.draw(self.pixels)
         elif self.sub_pattern == 1:
             # 軌跡パーティクル
             points = list(self.trails)
@@ -334,20 +451,17 @@ class EnhancedVJ:
                     pyxel.line(p1[0], p1[1], p2[0], p2[1], color)
         elif self.sub_pattern == 2:
             # 渦巻きパーティクル
-            for i in range(int(32 * self.complexity)):
-                angle = self.rotation + i * 0.2 + t * 0.05
-                r = i * 2 * self.scale * beat_scale
-                px = x + math.cos(angle) * r
-                py = y + math.sin(angle) * r
+            index = np.arange(int(32 * self.complexity))
+            xs, ys = trig.polar(x, y, self.rotation + index * 0.2 + t * 0.05, index * 2 * self.scale * beat_scale)
+            for i, (px, py) in enumerate(zip(xs.tolist(), ys.tolist())):
                 color = (int(self.color_phase) + i // 4) % 16
                 pyxel.pset(px, py, color)
         else:
             # 爆発パーティクル
-            for i in range(int(50 * self.complexity)):
-                angle = self.rotation + i * math.pi * 2 / (50 * self.complexity)
-                r = 40 * self.scale * beat_scale * (1 + math.sin(t * 0.1))
-                px = x + math.cos(angle) * r
-                py = y + math.sin(angle) * r
+            index = np.arange(int(50 * self.complexity))
+            r = 40 * self.scale * beat_scale * (1 + math.sin(t * 0.1))
+            xs, ys = trig.polar(x, y, self.rotation + index * math.pi * 2 / (50 * self.complexity), r)
+            for i, (px, py) in enumerate(zip(xs.tolist(), ys.tolist())):
                 color = (int(self.color_phase) + i // 8) % 16
                 pyxel.pset(px, py, color)
 
@@ -355,59 +469,41 @@ class EnhancedVJ:
         """波形パターンの描画"""
         if self.sub_pattern == 0:
             # サイン波
-            points = []
-            for i in range(256):
-                angle = i * math.pi / 32 + self.wave_phase
-                r = 80 * self.scale * beat_scale
-                px = i
-                py = y + math.sin(angle) * r * self.intensity
-                points.append((px, py))
-            for i in range(len(points) - 1):
-                p1 = points[i]
-                p2 = points[i + 1]
-                color = (int(self.color_phase) + i // 16) % 16
-                pyxel.line(p1[0], p1[1], p2[0], p2[1], color)
+            index = np.arange(256)
+            r = 80 * self.scale * beat_scale
+            ys = y + trig.sin_array(index * math.pi / 32 + self.wave_phase) * r * self.intensity
+            colors = (int(self.color_phase) + index[:-1] // 16) % 16
+            draw_polyline(self.pixels, index, ys, colors)
         elif self.sub_pattern == 1:
             # 円形波
-            for r in range(0, int(100 * self.scale * beat_scale), 10):
-                points = []
-                num_points = int(16 * self.complexity)
-                for i in range(num_points):
-                    angle = i * math.pi * 2 / num_points + self.wave_phase
-                    wave = math.sin(angle * 8) * 10 * self.intensity
-                    px = x + math.cos(angle) * (r + wave)
-                    py = y + math.sin(angle) * (r + wave)
-                    points.append((px, py))
-                for i in range(len(points)):
-                    p1 = points[i]
-                    p2 = points[(i + 1) % len(points)]
-                    color = (int(self.color_phase) + r // 10) % 16
-                    pyxel.line(p1[0], p1[1], p2[0], p2[1], color)
+            # 角度と波の高さは半径によらないので、全ての輪の点を (輪, 点) の配列でまとめて計算する
+            num_points = int(16 * self.complexity)
+            angles = np.arange(num_points) * math.pi * 2 / num_points + self.wave_phase
+            waves = trig.sin_array(angles * 8) * 10 * self.intensity
+            radii = np.arange(0, int(100 * self.scale * beat_scale), 10)
+            xs, ys = trig.polar(x, y, angles, radii[:, np.newaxis] + waves)
+            # 各輪の点から次の点（最後の点は最初の点）への線分を、全ての輪の分まとめて draw_segments に渡す
+            next_xs = np.roll(xs, -1, axis=1)
+            next_ys = np.roll(ys, -1, axis=1)
+            colors = np.repeat((int(self.color_phase) + radii // 10) % 16, num_points)
+            draw_segments(self.pixels, xs.ravel(), ys.ravel(), next_xs.ravel(), next_ys.ravel(), colors)
         elif self.sub_pattern == 2:
             # リサージュ波形
-            points = []
-            for i in range(int(100 * self.complexity)):
-                t_val = i * 0.1 + self.wave_phase
-                px = x + math.sin(t_val * 2) * 80 * self.scale * beat_scale
-                py = y + math.sin(t_val * 3) * 80 * self.scale * beat_scale
-                points.append((px, py))
-            for i in range(len(points) - 1):
-                p1 = points[i]
-                p2 = points[i + 1]
-                color = (int(self.color_phase) + i // 8) % 16
-                pyxel.line(p1[0], p1[1], p2[0], p2[1], color)
+            index = np.arange(int(100 * self.complexity))
+            ts = index * 0.1 + self.wave_phase
+            r = 80 * self.scale * beat_scale
+            xs = x + trig.sin_array(ts * 2) * r
+            ys = y + trig.sin_array(ts * 3) * r
+            draw_polyline(self.pixels, xs, ys, (int(self.color_phase) + index[:-1] // 8) % 16)
         else:
             # ノイズ波形
-            points = []
-            for i in range(256):
-                px = i
-                py = y + (pyxel.noise(i * 0.05 + self.wave_phase, 0) * 2 - 1) * 80 * self.scale * beat_scale * self.intensity
-                points.append((px, py))
-            for i in range(len(points) - 1):
-                p1 = points[i]
-                p2 = points[i + 1]
-                color = (int(self.color_phase) + i // 16) % 16
-                pyxel.line(p1[0], p1[1], p2[0], p2[1], color)
+            index = np.arange(256)
+            amplitude = 80 * self.scale * beat_scale * self.intensity
+            # 波形は wave_phase の分だけ横にずれるだけなので、テーブルをずらして引く
+            xs = index * 0.05 + self.wave_phase
+            noise = self.noise_table.fractal(xs, NOISE_OCTAVES) if self.noise_fractal else self.noise_table.sample(xs)
+            ys = y + (noise * 2 - 1) * amplitude
+            draw_polyline(self.pixels, index, ys, (int(self.color_phase) + index[:-1] // 16) % 16)
 
     def draw_geometric(self, x, y, beat_scale):
         """幾何学パターンの描画"""
@@ -415,51 +511,32 @@ class EnhancedVJ:
         if self.sub_pattern == 0:
             # 万華鏡
             num_lines = int(16 * self.complexity)
-            for i in range(num_lines):
-                angle = self.rotation + i * math.pi / num_lines
-                r = 100 * self.scale * beat_scale
-                x1 = x + math.cos(angle) * r
-                y1 = y + math.sin(angle) * r
-                x2 = x + math.cos(angle + math.pi) * r
-                y2 = y + math.sin(angle + math.pi) * r
+            # 反対側の端点は cos(θ+π) = -cos(θ), sin(θ+π) = -sin(θ) で求める
+            r = 100 * self.scale * beat_scale
+            dxs, dys = trig.polar(0, 0, self.rotation + np.arange(num_lines) * math.pi / num_lines, r)
+            for i, (dx, dy) in enumerate(zip(dxs.tolist(), dys.tolist())):
                 color = (int(self.color_phase) + i) % 16
-                pyxel.line(x1, y1, x2, y2, color)
+                pyxel.line(x + dx, y + dy, x - dx, y - dy, color)
         elif self.sub_pattern == 1:
             # 螺旋
-            points = []
-            num_points = int(100 * self.complexity)
-            for i in range(num_points):
-                angle = self.rotation + i * 0.2
-                r = i * 0.5 * self.scale * beat_scale
-                px = x + math.cos(angle) * r
-                py = y + math.sin(angle) * r
-                points.append((px, py))
-            for i in range(len(points) - 1):
-                p1 = points[i]
-                p2 = points[i + 1]
-                color = (int(self.color_phase) + i // 8) % 16
-                pyxel.line(p1[0], p1[1], p2[0], p2[1], color)
+            index = np.arange(int(100 * self.complexity))
+            xs, ys = trig.polar(x, y, self.rotation + index * 0.2, index * 0.5 * self.scale * beat_scale)
+            draw_polyline(self.pixels, xs, ys, (int(self.color_phase) + index[:-1] // 8) % 16)
         elif self.sub_pattern == 2:
             # 多角形
             num_vertices = int(3 + self.complexity * 5)
-            points = []
-            for i in range(num_vertices):
-                angle = self.rotation + i * math.pi * 2 / num_vertices
-                r = 80 * self.scale * beat_scale
-                px = x + math.cos(angle) * r
-                py = y + math.sin(angle) * r
-                points.append((px, py))
-            for i in range(num_vertices):
-                for j in range(i + 1, num_vertices):
-                    color = (int(self.color_phase) + (i + j)) % 16
-                    pyxel.line(points[i][0], points[i][1], points[j][0], points[j][1], color)
+            angles = self.rotation + np.arange(num_vertices) * math.pi * 2 / num_vertices
+            xs, ys = trig.polar(x, y, angles, 80 * self.scale * beat_scale)
+            # 全ての頂点の組 (i, j)（i < j）を結ぶ線分をまとめて draw_segments に渡す
+            i, j = np.triu_indices(num_vertices, 1)
+            colors = (int(self.color_phase) + (i + j)) % 16
+            draw_segments(self.pixels, xs[i], ys[i], xs[j], ys[j], colors)
         else:
             # モアレ
             size = 100 * self.scale * beat_scale
-            for i in range(int(8 * self.complexity)):
-                angle = self.rotation + i * math.pi / 8
-                dx = math.cos(angle) * i * 5
-                dy = math.sin(angle) * i * 5
+            index = np.arange(int(8 * self.complexity))
+            dxs, dys = trig.polar(0, 0, self.rotation + index * math.pi / 8, index * 5)
+            for i, (dx, dy) in enumerate(zip(dxs.tolist(), dys.tolist())):
                 color = (int(self.color_phase) + i) % 16
                 pyxel.circb(x + dx, y + dy, size - i * 5, color)
 
@@ -1,6 +1,8 @@
 import pyxel
 import math
 
+from common.input_layer import InputLayer
+
 # 拡張オーディオ設定用定数
 EXTENDED_CHANNELS = [
     (0.1 / 2.0, 0),  # Lead Melody
@@ -113,22 +115,17 @@ class VJArt:
         self.pos_x = self.WIDTH // 2
         self.pos_y = self.HEIGHT // 2
 
-        pyxel.run(self.update, self.draw)
+        # アナログ入力とキーボード対応（入力レイヤーで1フレームに1回だけ読み取る）
+        self.analog_inputs = [
+            ("GAMEPAD1_AXIS_LEFTX", [pyxel.KEY_D, pyxel.KEY_A]),
+            ("GAMEPAD1_AXIS_LEFTY", [pyxel.KEY_S, pyxel.KEY_W]),
+        ]
+        self.input = InputLayer(self.analog_inputs)
 
-    def get_axis(self, axis_name, keyboard_keys):
-        # アナログ入力値の取得（キーボード入力の場合は最大値を返す）
-        value = pyxel.btnv(getattr(pyxel, axis_name))
-        if len(keyboard_keys) == 2:
-            if pyxel.btn(keyboard_keys[0]):
-                value = 32767
-            elif pyxel.btn(keyboard_keys[1]):
-                value = -32768
-        elif len(keyboard_keys) == 1:
-            if pyxel.btn(keyboard_keys[0]):
-                value = 32767
-        return value
+        pyxel.run(self.update, self.draw)
 
     def update(self):
+        self.input.poll()
         self.t += 1
         # 終了処理：STARTボタンまたはESCキーで終了
         if pyxel.btnp(pyxel.GAMEPAD1_BUTTON_START) or pyxel.btnp(pyxel.KEY_ESCAPE):
@@ -141,8 +138,8 @@ class VJArt:
             pyxel.play(7, self.current_pattern)
 
         # アナログ入力（左スティックまたはキーボード D/A, S/W）で位置更新
-        axis_x = self.get_axis("GAMEPAD1_AXIS_LEFTX", [pyxel.KEY_D, pyxel.KEY_A])
-        axis_y = self.get_axis("GAMEPAD1_AXIS_LEFTY", [pyxel.KEY_S, pyxel.KEY_W])
+        axis_x = self.input.value("GAMEPAD1_AXIS_LEFTX")
+        axis_y = self.input.value("GAMEPAD1_AXIS_LEFTY")
         self.pos_x = int((axis_x + 32768) / 65535 * self.WIDTH)
         self.pos_y = int((axis_y + 32768) / 65535 * self.HEIGHT)
 
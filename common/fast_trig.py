@@ -0,0 +1,128 @@
+"""角度を量子化した sin/cos テーブルと、点群をまとめて回転・拡大するヘルパー
+
+VJ系のアプリは毎フレーム大量の math.cos / math.sin を呼んでいる。このモジュールでは
+1周を resolution 個に分割したテーブルを起動時に1回だけ作り、角度の配列をまとめて引く。
+1点ずつの呼び出しは math の方が速いので、点群を numpy 配列で一度に計算する用途に使う。
+
+誤差は最大で sin(π / resolution) 程度（既定の 4096 分割で約 0.0008）。
+リポジトリのルートで `python -m common.fast_trig` を実行すると、精度の確認と math 版とのベンチマークができる。
+"""
+
+import math
+
+import numpy as np
+
+DEFAULT_RESOLUTION = 4096
+TAU = math.pi * 2
+
+
+class TrigTable:
+    """1周を resolution 個に分割した sin/cos テーブル"""
+
+    def __init__(self, resolution=DEFAULT_RESOLUTION):
+        self.resolution = resolution
+        self.index_scale = resolution / TAU  # 角度（ラジアン）からテーブルの位置への変換係数
+        angles = np.arange(resolution) * (TAU / resolution)
+        self.sin_table = np.sin(angles)
+        self.cos_table = np.cos(angles)
+        # 1点ずつ引く場合は numpy の要素アクセスより list の方が速い
+        self.sin_list = self.sin_table.tolist()
+        self.cos_list = self.cos_table.tolist()
+
+    def max_error(self):
+        """量子化による誤差の上限"""
+        return math.sin(math.pi / self.resolution)
+
+    def index(self, angles):
+        """角度の配列を最も近いテーブルの位置へ変換する"""
+        return np.rint(np.asarray(angles) * self.index_scale).astype(np.int64) % self.resolution
+
+    def sin(self, angle):
+        return self.sin_list[round(angle * self.index_scale) % self.resolution]
+
+    def cos(self, angle):
+        return self.cos_list[round(angle * self.index_scale) % self.resolution]
+
+    def sin_array(self, angles):
+        return self.sin_table[self.index(angles)]
+
+    def cos_array(self, angles):
+        return self.cos_table[self.index(angles)]
+
+    def polar(self, cx, cy, angles, radii):
+        """中心 (cx, cy) から角度 angles、半径 radii の位置にある点群の座標配列を返す"""
+        index = self.index(angles)
+        return cx + self.cos_table[index] * radii, cy + self.sin_table[index] * radii
+
+    def ring(self, start, count):
+        """角度 start から1周を count 等分した方向の単位ベクトルを (cos, sin) のリストで返す"""
+        index = self.index(start + np.arange(count) * (TAU / count))
+        return list(zip(self.cos_table[index].tolist(), self.sin_table[index].tolist()))
+
+    def rotate_scale(self, xs, ys, angle, scale=1.0, cx=0.0, cy=0.0):
+        """点群を原点まわりに angle 回転して scale 倍し、(cx, cy) へ平行移動する"""
+        index = round(angle * self.index_scale) % self.resolution
+        c = self.cos_list[index] * scale
+        s = self.sin_list[index] * scale
+        xs = np.asarray(xs)
+        ys = np.asarray(ys)
+        return cx + xs * c - ys * s, cy + xs * s + ys * c
+
+
+# アプリ内のモジュールで共有する既定のテーブル
+table = TrigTable()
+
+
+def check_accuracy(trig=table, samples=100000):
+    """ランダムな角度で math 版と比較し、最大誤差を返す（上限を超えたら AssertionError）"""
+    rng = np.random.default_rng(0)
+    angles = rng.uniform(-100.0, 100.0, samples)
+    error = max(
+        float(np.abs(trig.sin_array(angles) - np.sin(angles)).max()),
+        float(np.abs(trig.cos_array(angles) - np.cos(angles)).max()),
+    )
+    for angle in angles[:1000].tolist():
+        error = max(error, abs(trig.sin(angle) - math.sin(angle)), abs(trig.cos(angle) - math.cos(angle)))
+    assert error <= trig.max_error() + 1e-12, f"error {error} exceeds {trig.max_error()}"
+
+    # 回転は math 版の回転行列と一致すること（角度の量子化分の誤差のみ）
+    xs = rng.uniform(-100.0, 100.0, 1000)
+    ys = rng.uniform(-100.0, 100.0, 1000)
+    angle = 1.234
+    rx, ry = trig.rotate_scale(xs, ys, angle, 2.0, 10.0, 20.0)
+    ex = 10.0 + (xs * math.cos(angle) - ys * math.sin(angle)) * 2.0
+    ey = 20.0 + (xs * math.sin(angle) + ys * math.cos(angle)) * 2.0
+    radius = float(np.hypot(xs, ys).max()) * 2.0
+    assert np.abs(rx - ex).max() <= radius * trig.max_error() * 2 + 1e-9
+    assert np.abs(ry - ey).max() <= radius * trig.max_error() * 2 + 1e-9
+    return error
+
+
+def benchmark(trig=table, points=256, repeat=2000):
+    """points 個の点を極座標から変換する処理を math 版と比較し、1回あたりの時間（マイクロ秒）を返す"""
+    import timeit
+
+    angles = (np.arange(points) * 0.1).tolist()
+    radii = 80.0
+
+    def with_math():
+        return [(math.cos(a) * radii, math.sin(a) * radii) for a in angles]
+
+    def with_table_scalar():
+        return [(trig.cos(a) * radii, trig.sin(a) * radii) for a in angles]
+
+    def with_table_array():
+        return trig.polar(0.0, 0.0, angles, radii)
+
+    results = {}
+    for name, func in (("math", with_math), ("table scalar", with_table_scalar), ("table array", with_table_array)):
+        results[name] = min(timeit.repeat(func, number=repeat, repeat=3)) / repeat * 1e6
+    return results
+
+
+if __name__ == "__main__":
+    for resolution in (1024, DEFAULT_RESOLUTION, 16384):
+        trig = TrigTable(resolution)
+        print(f"resolution {resolution:6d}: max error {check_accuracy(trig):.6f} (bound {trig.max_error():.6f})")
+    for name, us in benchmark().items():
+        print(f"{name:>12}: {us:8.2f} us / 256 points")
@@ -0,0 +1,131 @@
+"""共通モジュールの配布と、各アプリの Pyxel パッケージ（pyxapp）の作成
+
+共通モジュールの正本はリポジトリのルートの common パッケージにある。各アプリは単体で実行・パッケージ化
+できるように、使うモジュールだけを自分のディレクトリの common パッケージに複製して持つ。
+どのモジュールを使うかは、アプリのスクリプトの `from common.xxx import` と、common 内の相対インポートから求める。
+
+    python tools/build.py                # 複製を更新し、全アプリの pyxapp をリポジトリのルートに作る
+    python tools/build.py 0004_vj        # 指定したアプリだけ
+    python tools/build.py --check        # 複製が正本と違えば一覧を表示して終了コード 1 で終わる
+"""
+
+import argparse
+import re
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+COMMON = ROOT / "common"
+
+APP_IMPORT = re.compile(r"^\s*(?:from|import)\s+common\.(\w+)", re.MULTILINE)
+RELATIVE_IMPORT = re.compile(r"^\s*from\s+\.(\w+)\s+import", re.MULTILINE)
+
+
+def find_apps():
+    """アプリのディレクトリ（番号付き）と、その直下にある起動スクリプトの組を列挙する"""
+    apps = []
+    for app_dir in sorted(ROOT.glob("[0-9][0-9][0-9][0-9]_*")):
+        if not app_dir.is_dir():
+            continue
+        scripts = sorted(app_dir.glob("*.py"))
+        if len(scripts) != 1:
+            raise SystemExit(f"{app_dir.name}: expected one startup script, found {len(scripts)}")
+        apps.append((app_dir, scripts[0]))
+    return apps
+
+
+def required_modules(script):
+    """スクリプトが使う共通モジュールのファイル名を、common 内での依存も含めて返す"""
+    pending = APP_IMPORT.findall(script.read_text(encoding="utf-8"))
+    modules = set()
+    while pending:
+        name = pending.pop()
+        if name in modules:
+            continue
+        source = COMMON / f"{name}.py"
+        if not source.exists():
+            raise SystemExit(f"{script.relative_to(ROOT)}: common.{name} does not exist")
+        modules.add(name)
+        pending.extend(RELATIVE_IMPORT.findall(source.read_text(encoding="utf-8")))
+    if not modules:
+        return []
+    return ["__init__.py"] + sorted(f"{name}.py" for name in modules)
+
+
+def differences(app_dir, files):
+    """アプリの common パッケージと正本の違いを (ファイルのパス, 内容) のリストで返す"""
+    target = app_dir / "common"
+    result = []
+    for name in files:
+        copy = target / name
+        if not copy.exists():
+            result.append((copy, "missing"))
+        elif copy.read_bytes() != (COMMON / name).read_bytes():
+            result.append((copy, "differs from common/" + name))
+    if target.exists():
+        for copy in sorted(target.glob("*.py")):
+            if copy.name not in files:
+                result.append((copy, "not used by the app"))
+    return result
+
+
+def sync(app_dir, files):
+    """アプリの common パッケージを正本に合わせる（使わないモジュールは削除する）"""
+    target = app_dir / "common"
+    for copy, _ in differences(app_dir, files):
+        if copy.name in files:
+            target.mkdir(exist_ok=True)
+            shutil.copyfile(COMMON / copy.name, copy)
+        else:
+            copy.unlink()
+    if target.exists() and not files:
+        shutil.rmtree(target)
+
+
+def package(app_dir, script):
+    """pyxel package で <アプリのディレクトリ名>.pyxapp をリポジトリのルートに作る"""
+    # ディレクトリの中身がそのまま入るので、実行時に作られたキャッシュは消しておく
+    for cache in list(app_dir.rglob("__pycache__")):
+        shutil.rmtree(cache)
+    subprocess.run(
+        ["pyxel", "package", app_dir.name, str(script.relative_to(ROOT))],
+        cwd=ROOT,
+        check=True,
+    )
+    return ROOT / f"{app_dir.name}.pyxapp"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy the common modules into the apps and build their pyxapps")
+    parser.add_argument("apps", nargs="*", metavar="APP_DIR", help="app directories to process (default: all)")
+    parser.add_argument("--check", action="store_true", help="only check that the copies match common/")
+    args = parser.parse_args()
+
+    apps = find_apps()
+    if args.apps:
+        names = {Path(name).name for name in args.apps}
+        unknown = names - {app_dir.name for app_dir, _ in apps}
+        if unknown:
+            parser.error("unknown app: " + ", ".join(sorted(unknown)))
+        apps = [(app_dir, script) for app_dir, script in apps if app_dir.name in names]
+
+    if args.check:
+        stale = []
+        for app_dir, script in apps:
+            stale.extend(differences(app_dir, required_modules(script)))
+        for copy, reason in stale:
+            print(f"{copy.relative_to(ROOT)}: {reason}")
+        if stale:
+            print("run `python tools/build.py` to update the copies")
+            sys.exit(1)
+        return
+
+    for app_dir, script in apps:
+        sync(app_dir, required_modules(script))
+        print(f"built {package(app_dir, script).relative_to(ROOT)}")
+
+
+if __name__ == "__main__":
+    main()